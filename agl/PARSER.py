@@ -39,13 +39,22 @@
 # shaping in one time step.
 
 
-__all__ = ['PARSER']
+__all__ = ['PARSER', 'BatchResult', 'WeightRecorder']
 
+import copy
+import json
 import random
 import sys
 import logging
+import math
+import numpy as np
+import pandas as pd
 
-from collections import defaultdict
+from array import array
+from collections import Counter, defaultdict
+from heapq import heapify, heappop, heappush
+from itertools import chain, repeat
+from time import perf_counter
 from .strfuncs import lengthnsubstrings
 
 
@@ -85,20 +94,68 @@ class PARSER:
     maxperceptsize: int
         The maximum number of percepts that are perceived in one
         step (should be at least 1). Defaults to 3
-    randomseed: int or None
-        The seed for the random generator. Use for repeatability. If None,
-        the current system time is used. Default is None.
+    randomseed: non-negative int or None
+        The seed for the random generator. Use for repeatability: models with
+        the same seed and parameters draw the same percept sizes. If None,
+        a random seed is generated, which is available as the `randomseed`
+        property. Default is None.
     readingframe: positive int, default 1
         The number of characters that make up one string token. Normally 1,
         so that, e.g. the string "abcd" has 4 tokens. However if there exist
         many tokens, these can be coded with multiple ascii symbols. E.g., if
         readingframe is 2, then "a1a2" has two tokens, namely "a1" and "a2".
+    encodetokens: bool
+        If True, tokens are encoded as small integers, packed in bytes, and
+        the model works on an encoded version of the input. This avoids
+        string operations on multi-character tokens and is mainly useful
+        when readingframe > 1. The `perceptshaper` property and the `weight`
+        method take and give decoded units, as without encoding. Default is
+        False.
+    maxunits: int or None
+        The maximum number of units in the percept shaper. If the percept
+        shaper grows larger at the end of a step, units are pruned according
+        to `pruningpolicy`. This bounds memory use and the cost of a step on
+        very long inputs, at the cost of deviating from the original model.
+        Pruned primitives are not forgotten, i.e. they can return. See the
+        `pruningstats` property. Default is None, meaning no limit.
+    pruningpolicy: {'lowestweight', 'leastrecent'}
+        Which units are pruned when the percept shaper exceeds `maxunits`:
+        those with the lowest weight, or those that were least recently
+        reinforced, i.e. created or strengthened by being perceived.
+        Default is 'lowestweight'.
+    recorder: WeightRecorder or None
+        If given, the recorder records all weight changes, novel units and
+        removals of units in the percept shaper. Default is None.
+    tracer: callable or None
+        A function that is called at the start and end of every step and of
+        each of its stages, and when units interfere or are removed. It is
+        called as `tracer(model, event, **info)`, in which `event` is a
+        string describing the event and `info` contains the relevant data.
+        Data are passed as is, in the internal representation of the model
+        (see `encodetokens`), so that tracing only costs what the tracer
+        does with them. Default is None, in which case the model traces to
+        its logger, but only if it is enabled for the INFO level.
+    profile: bool
+        Whether to keep cumulative timers and counters of the phases of the
+        steps, which are available as the `stats` property. Default is
+        False, in which case no time is spent on this.
     logginglevel: int
         Sets the threshold for logger to givenlevel. Logging messages which
         are less severe than level will be ignored; logging messages which have
         severity level or higher will be emitted by whichever handler or
         handlers service this logger, unless a handler’s level has been set to
-        a higher severity level than level.Defaults to logging.CRITICAL (50)
+        a higher severity level than level.Defaults to logging.CRITICAL (50).
+        Set to logging.INFO to trace every step of the model in the log.
+
+    Notes
+    -----
+    The `perceptshaper` property returns a new dictionary on every access: a
+    snapshot of the current weights, which does not follow later runs of the
+    model, and which takes time proportional to the size of the percept
+    shaper to build. Changes made to the most recent snapshot are taken over
+    by the model the next time it is used; changes to older snapshots are
+    ignored. To look up the weight of single units, e.g. in a loop, use the
+    `weight` method, which does not copy the percept shaper.
 
     References
     ----------
@@ -109,7 +166,9 @@ class PARSER:
     def __init__(self, primitives, perceptshaper=None, shapingthreshold=1.0,
                  newunitweight=1.0, forgetweight=-0.05, consolidationweight=0.5,
                  interferenceweight=-0.005, minperceptsize=1, maxperceptsize=3,
-                 randomseed=None, readingframe=1, logginglevel=logging.CRITICAL):
+                 randomseed=None, readingframe=1, encodetokens=False,
+                 maxunits=None, pruningpolicy='lowestweight', recorder=None,
+                 tracer=None, profile=False, logginglevel=logging.CRITICAL):
         if len(primitives) == 0:
             raise ValueError("`primitives` parameter cannot be empty")
         else:
@@ -119,10 +178,39 @@ class PARSER:
                                      f"a readingframe of {readingframe}")
         self._primitives = set(primitives)
         self._readingframe = readingframe
+        # Internally, units are either strings, or, if tokens are encoded,
+        # bytes in which each token code takes `_tokenwidth` bytes
+        if encodetokens:
+            self._tokencodes = {}
+            self._tokens = []
+            tokens = set(self._primitives)
+            if perceptshaper is not None:
+                for unit in perceptshaper:
+                    tokens.update(lengthnsubstrings(unit, 1, readingframe))
+            # leave room for tokens in the input that are not known yet;
+            # codes are widened later if the input has more of those
+            self._tokenwidth = 1
+            while 256 ** self._tokenwidth < 2 * len(tokens):
+                self._tokenwidth *= 2
+            for p in sorted(self._primitives):
+                self._encodetoken(p)
+            self._emptyunit = b''
+        else:
+            self._tokencodes = None
+            self._tokenwidth = readingframe
+            self._emptyunit = ''
+        self._primitiveunits = {self._encode(p) for p in self._primitives}
         self._forgottenprimitives = set()
+        # Forgetting is applied lazily. The percept shaper dict holds the
+        # weight of each unit as it was at the forgetting clock value stored
+        # in _laststep, i.e. when the unit was last changed. Its current
+        # weight follows from the number of forgetting cycles since then.
+        self._forgetclock = 0
         self._perceptshaper = {}
+        self._laststep = {}
         if perceptshaper is not None:
-            self._perceptshaper.update(perceptshaper)
+            self._perceptshaper.update((self._encode(unit), weight)
+                                       for unit, weight in perceptshaper.items())
         self._shapingthreshold = shapingthreshold
         self._newunitweight = newunitweight
         self._forgetweight = forgetweight
@@ -130,25 +218,155 @@ class PARSER:
         self._interferenceweight = interferenceweight
         self._minperceptsize = minperceptsize
         self._maxperceptsize = maxperceptsize
-        #FIXME this can't be correct
-        if randomseed is not None:
+        self._checkparams(maxunits=maxunits, pruningpolicy=pruningpolicy)
+        self._maxunits = maxunits
+        self._pruningpolicy = pruningpolicy
+        if randomseed is None:
             randomseed = random.randrange(sys.maxsize)
-        self._randomseed = randomseed
-        self._random = random.Random(self._randomseed)
+        self._seedrandom(randomseed)
         self._stepno = 0 # counter to keep track of how many steps were done
         self._weightdeltas = {} # cleared each step; used to keep track of weight adjustments
         self._novelunits = set({})
+        self._perceivedunits = [] # units perceived in the last step
+        # index of units in percept shaper with a weight above the shaping
+        # threshold (i.e. units that shape perception), and the number of
+        # such units per length, so that the longest one is known without
+        # scanning the percept shaper
+        self._memoryunits = set()
+        self._memoryunitlengths = Counter()
+        # the same memory units in a prefix trie of nested dictionaries,
+        # keyed on tokens, for finding the longest memory unit at the head
+        # of the input in one walk. The None key marks the end of a unit.
+        self._memorytrie = {}
+        # inverted index from primitives to the units in the percept shaper
+        # that contain them, with the number of occurrences
+        self._primitiveindex = defaultdict(dict)
+        # the decomposition of every unit in the percept shaper into
+        # primitives, as a Counter of primitives
+        self._unitcounts = {}
+        # priority queues with the forgetting clock values at which units
+        # drop to a weight of zero or drop below the shaping threshold
+        self._expiryqueue = []
+        self._thresholdqueue = []
+        # for a capped percept shaper, a priority queue with the units in
+        # the order in which they would be pruned, and the forgetting clock
+        # value at which units were last reinforced
+        self._pruningqueue = []
+        self._lastreinforced = {}
+        self._pruningstats = {'npruned': 0, 'nprunesteps': 0,
+                              'prunedweight': 0., 'maxprunedweight': 0.}
+        # the dictionary handed out by the perceptshaper property, with a
+        # copy to detect changes by the caller, see _syncperceptshaper
+        self._exposedweights = None
+        # number of models, including this one, that share the containers of
+        # the learned state above (see fork)
+        self._sharedstate = [1]
+        self._buildindex()
         self.logger = logging.getLogger()
         self.logger.setLevel(logginglevel)
+        # the tracer that is actually used is decided at the start of a run,
+        # see _settracer
+        self._usertracer = tracer
+        self._tracer = None
+        self._recorder = recorder
+        if recorder is not None:
+            recorder._attach(self)
+        self._stats = None
+        if profile:
+            self.reset_stats()
 
     @property
     def readingframe(self):
         return self._readingframe
 
+    @property
+    def encodetokens(self):
+        """Whether tokens are encoded internally."""
+        return self._tokencodes is not None
+
+    @property
+    def recorder(self):
+        """The WeightRecorder of the model, or None"""
+        return self._recorder
+
+    # names of the timers and counters in stats
+    _statsnames = ('nsteps', 'perceivetime', 'strengthentime',
+                   'interferetime', 'updatetime', 'forgettime', 'prunetime',
+                   'nscanned', 'ninterferencepairs', 'nunitscreated',
+                   'nunitsremoved')
+
+    @property
+    def profile(self):
+        """Whether the model keeps timers and counters, see `stats`"""
+        return self._stats is not None
+
+    @property
+    def stats(self):
+        """Dictionary with cumulative timers and counters of the phases of
+        the steps, or None if the model does not profile (see the `profile`
+        parameter). They are:
+
+        - 'nsteps': the number of steps
+        - 'perceivetime': seconds spent perceiving units
+        - 'strengthentime': seconds spent strengthening the percept and its
+          units, and determining which units are novel
+        - 'interferetime': seconds spent on interference
+        - 'updatetime': seconds spent applying the weight changes at the end
+          of steps, including the removal of units
+        - 'forgettime': seconds spent on forgetting
+        - 'prunetime': seconds spent pruning units (see `maxunits`)
+        - 'nscanned': the number of lookups of tokens in memory units
+          during perception
+        - 'ninterferencepairs': the number of pairs of perceived unit and
+          unit sharing primitives that were evaluated for interference
+        - 'nunitscreated': the number of units added to the percept shaper
+        - 'nunitsremoved': the number of units removed from the percept
+          shaper, because of forgetting, interference or pruning
+
+        """
+        return None if self._stats is None else dict(self._stats)
+
+    def reset_stats(self):
+        """Sets all timers and counters in `stats` to zero, and starts
+        profiling if the model did not yet profile."""
+        self._stats = dict.fromkeys(self._statsnames, 0)
+        for name in self._statsnames:
+            if name.endswith('time'):
+                self._stats[name] = 0.
+
     @property
     def perceptshaper(self):
-        """Dictionary with percepts (chunks) as keys and weights as values"""
-        return self._perceptshaper
+        """Dictionary with percepts (chunks) as keys and their current
+        weights as values. This is a new snapshot on every access; changes
+        to the most recent one are taken over by the model the next time it
+        is used (see Notes in the class documentation)."""
+        # the dictionary may be changed by the caller; changes are taken
+        # over when the model is used next
+        self._syncperceptshaper()
+        if self._tokencodes is not None:
+            weights = self._decodedweights()
+        else:
+            weights = self._currentweights()
+        self._exposedweights = (weights, dict(weights))
+        return weights
+
+    def weight(self, unit):
+        """Returns the current weight of `unit` in the percept shaper.
+
+        Unlike the `perceptshaper` property, this does not copy the percept
+        shaper, so that it is cheap for single units.
+
+        Raises
+        ------
+        KeyError
+            If `unit` is not in the percept shaper.
+
+        """
+        self._syncperceptshaper()
+        parts = self._encodeknown(unit)
+        if len(parts) != 1 or parts[0] not in self._perceptshaper:
+            raise KeyError(unit)
+        return self._weight(parts[0])
 
     @property
     def shapingthreshold(self):
@@ -191,6 +409,27 @@ class PARSER:
         step (should be at least 1)"""
         return self._maxperceptsize
 
+    @property
+    def maxunits(self):
+        """The maximum number of units in the percept shaper, or None"""
+        return self._maxunits
+
+    @property
+    def pruningpolicy(self):
+        """Which units are pruned when the percept shaper exceeds
+        `maxunits`"""
+        return self._pruningpolicy
+
+    @property
+    def pruningstats(self):
+        """Dictionary with statistics on the units that were pruned because
+        the percept shaper exceeded `maxunits`: the number of pruned units
+        ('npruned'), the number of steps in which units were pruned
+        ('nprunesteps'), and the summed and maximum weight of the pruned
+        units at the moment of pruning ('prunedweight', 'maxprunedweight').
+        """
+        return dict(self._pruningstats)
+
     @property
     def primitives(self):
         """list of primitives (='syllables')"""
@@ -215,26 +454,433 @@ class PARSER:
             This is predominantly useful when debugging, inspecting or
             verifying every step in a deterministic way, e.g. to compare it
             to other implementations such as the original PARSER software by
-            Perruchet
-            .
+            Perruchet. If it has fewer elements than there are steps
+            needed to process inputstring, the run stops early.
+
         Returns
         -------
         str
-            Remainder of string that is not processed.
+            Remainder of string that is not processed. This is empty unless
+            `perceptsizes` is exhausted before the end of `inputstring`.
 
         """
-        remainder = inputstring
-        if perceptsizes is not None:
-            perceptsizes = (s for s in perceptsizes)
-        while remainder:
-            if perceptsizes is not None:
-                perceptsize = next(perceptsizes)
+        sequence = self._encode(inputstring)
+        pos = self._runsequence(sequence, perceptsizes=perceptsizes)
+        return self._decode(sequence[pos:])
+
+    @classmethod
+    def run_batch(cls, inputstring, primitives, seeds, params=None,
+                  **kwargs):
+        """Run a batch of PARSER models, e.g. "virtual subjects", on the same
+        input string. Subjects differ in their random seed, and possibly in
+        their model parameters.
+
+        The input string is encoded only once, and all models share the same
+        primitive and token tables.
+
+        Parameters
+        ----------
+        inputstring: str
+            The string of tokens to run the models on.
+        primitives: list
+            List of primitives from which words are build.
+        seeds: sequence of ints
+            The random seed of each subject. The number of seeds determines
+            the number of subjects.
+        params: dict, sequence of dicts, or None
+            Model parameters that differ between subjects, i.e.
+            `shapingthreshold`, `newunitweight`, `forgetweight`,
+            `consolidationweight`, `interferenceweight`, `minperceptsize`,
+            `maxperceptsize`, `maxunits` and `pruningpolicy`. Either one
+            dictionary per subject, or a single dictionary for all subjects.
+            Default None.
+        kwargs:
+            Other parameters of the PARSER models, common to all subjects,
+            such as `readingframe` or `perceptshaper`.
+
+        Returns
+        -------
+        BatchResult
+
+        """
+        if params is None:
+            params = {}
+        if isinstance(params, dict):
+            params = [params] * len(seeds)
+        elif len(params) != len(seeds):
+            raise ValueError(f"number of parameter sets ({len(params)}) "
+                             f"does not match number of seeds ({len(seeds)})")
+        for p in params:
+            invalid = set(p) - set(cls._subjectparams)
+            if invalid:
+                raise ValueError(f"parameters {invalid} cannot differ "
+                                 f"between subjects")
+            cls._checkparams(**p)
+        template = cls(primitives, **kwargs)
+        sequence = template._encode(inputstring)
+        perceptshapers = []
+        for seed, p in zip(seeds, params):
+            model = template.fork()
+            for name, value in p.items():
+                setattr(model, f'_{name}', value)
+            model._seedrandom(seed)
+            model._buildindex()
+            model._runsequence(sequence)
+            perceptshapers.append(model.perceptshaper)
+        return BatchResult(perceptshapers=perceptshapers, seeds=seeds,
+                           params=[{name: p.get(name, getattr(template, name))
+                                    for name in cls._subjectparams}
+                                   for p in params])
+
+    def score_items(self, items):
+        """Scores test items, e.g. words, part-words and non-words, against
+        the current state of the model, without changing it.
+
+        Each item is segmented as the model would perceive it, taking the
+        longest memory unit (unit with a weight above the shaping
+        threshold) at each position, or else a single token. The weights of
+        the resulting units in the percept shaper (0 if a unit is not in it)
+        are summed and maximized per item.
+
+        Parameters
+        ----------
+        items: iterable of str
+            The test items.
+
+        Returns
+        -------
+        tuple (segmentations, summed weights, maximum weights)
+            segmentations is a list with the units of each item. The
+            weights are numpy arrays with a value per item.
+
+        """
+        self._syncperceptshaper()
+        ps = self._perceptshaper
+        segmentations = []
+        sumweights = []
+        maxweights = []
+        for item in items:
+            segmentation = []
+            weights = []
+            for part in self._encodeknown(item):
+                if self._tokencodes is not None and isinstance(part, str):
+                    # a token without code is not part of any unit
+                    segmentation.append(part)
+                    weights.append(0.)
+                    continue
+                units, _ = self._segment(len(part), part)
+                segmentation.extend(self._decode(unit) for unit in units)
+                weights.extend(self._weight(unit) if unit in ps else 0.
+                               for unit in units)
+            segmentations.append(segmentation)
+            sumweights.append(sum(weights))
+            maxweights.append(max(weights, default=0.))
+        return segmentations, np.array(sumweights), np.array(maxweights)
+
+    def save_state(self, filename):
+        """Saves the complete state of the model to a compact binary file, in
+        numpy's `.npz` format, so that a run can be resumed or forked later
+        with `load_state`.
+
+        The state consists of the model parameters, the primitives, the
+        units in the percept shaper with their weights, the forgotten
+        primitives, the step counters and the state of the random generator.
+
+        Parameters
+        ----------
+        filename: str or file
+            Where to save the state. If a string without `.npz` extension,
+            that extension is added.
+
+        """
+        self._syncperceptshaper()
+        ps = self._perceptshaper
+        laststep = self._laststep
+        units = list(ps)
+        params = {name: getattr(self, name) for name in self._subjectparams}
+        params.update(readingframe=self.readingframe,
+                      encodetokens=self.encodetokens,
+                      randomseed=self.randomseed)
+        np.savez_compressed(
+            filename,
+            params=np.array(json.dumps(params)),
+            primitives=np.array(sorted(self._primitives), dtype=str),
+            tokens=np.array(self._tokens if self.encodetokens else [],
+                            dtype=str),
+            # weights at the forgetting clock value in laststep
+            units=np.array([self._decode(unit) for unit in units], dtype=str),
+            weights=np.array([ps[unit] for unit in units], dtype=np.float64),
+            laststep=np.array([laststep[unit] for unit in units],
+                              dtype=np.int64),
+            forgottenprimitives=np.array(
+                sorted(self._decode(unit)
+                       for unit in self._forgottenprimitives), dtype=str),
+            lastreinforced=np.array([self._lastreinforced.get(unit, -1)
+                                     for unit in units], dtype=np.int64),
+            pruningstats=np.array(json.dumps(self._pruningstats)),
+            counters=np.array([self._stepno, self._forgetclock],
+                              dtype=np.int64),
+            randomstate=np.array(json.dumps(self._random.bit_generator.state)),
+            perceptsizes=np.array(
+                self._perceptsizes[self._perceptsizepos:], dtype=np.int64))
+
+    @classmethod
+    def load_state(cls, filename, **kwargs):
+        """Creates a model from a state that was saved with `save_state`.
+        Running it continues exactly where the saved model was.
+
+        Parameters
+        ----------
+        filename: str or file
+            The saved state. As in `save_state`, the `.npz` extension is
+            added to a string without that extension.
+        kwargs:
+            Parameters of the model that are not part of its state, i.e.
+            `recorder`, `tracer`, `profile` and `logginglevel`.
+
+        Returns
+        -------
+        PARSER
+
+        """
+        recorder = kwargs.pop('recorder', None)
+        if isinstance(filename, str) and not filename.endswith('.npz'):
+            filename += '.npz'
+        with np.load(filename) as data:
+            params = json.loads(str(data['params']))
+            primitives = data['primitives'].tolist()
+            model = cls(primitives=primitives, **params, **kwargs)
+            if model.encodetokens:
+                tokens = data['tokens'].tolist()
+                model._tokencodes = {}
+                model._tokens = []
+                model._widentokens(len(tokens))
+                for token in tokens:
+                    model._encodetoken(token)
+                model._primitiveunits = {model._encode(p) for p in primitives}
+            units = [model._encode(unit) for unit in data['units'].tolist()]
+            model._perceptshaper = dict(zip(units, data['weights'].tolist()))
+            model._laststep = dict(zip(units, data['laststep'].tolist()))
+            model._lastreinforced = {
+                unit: clock for unit, clock
+                in zip(units, data['lastreinforced'].tolist()) if clock >= 0}
+            model._pruningstats = json.loads(str(data['pruningstats']))
+            model._forgottenprimitives = {
+                model._encode(unit)
+                for unit in data['forgottenprimitives'].tolist()}
+            model._stepno, model._forgetclock = data['counters'].tolist()
+            model._random.bit_generator.state = json.loads(
+                str(data['randomstate']))
+            model._perceptsizes = data['perceptsizes'].tolist()
+        model._buildindex()
+        if recorder is not None:
+            model._recorder = recorder
+            recorder._attach(model)
+        return model
+
+    def fork(self, randomseed=None):
+        """Returns a copy of the model that can be run independently, e.g. to
+        probe a trained model without disturbing its state.
+
+        Forking is cheap. The copy shares the primitive and token tables,
+        parameters and logger with the original. The learned state (the
+        percept shaper, forgotten primitives and the indices derived from
+        them) is shared as well, until either model changes it, at which
+        point that model gets its own copy (copy-on-write). Many forks that
+        are only inspected or used to score items therefore do not copy
+        anything.
+
+        Parameters
+        ----------
+        randomseed: int or None
+            If None, the fork continues with the same random state as the
+            original, so that both would behave identically on the same
+            input. Otherwise, the random generator of the fork is seeded
+            with this value.
+
+        Returns
+        -------
+        PARSER
+
+        """
+        self._syncperceptshaper()
+        self._exposedweights = None
+        model = copy.copy(self)
+        self._sharedstate[0] += 1
+        model._novelunits = set()
+        model._weightdeltas = {}
+        model._perceivedunits = []
+        if randomseed is None:
+            model._random = copy.deepcopy(self._random)
+        else:
+            model._seedrandom(randomseed)
+        model._recorder = None
+        if self._stats is not None:
+            model.reset_stats()
+        return model
+
+    @staticmethod
+    def _checkparams(maxunits=None, pruningpolicy='lowestweight', **params):
+        """Raises a ValueError if a model parameter has an invalid value.
+        Used by the constructor, and by run_batch for parameters that are
+        set per subject."""
+        if maxunits is not None and not (isinstance(maxunits, int)
+                                         and maxunits > 0):
+            raise ValueError(f"maxunits ({maxunits}) should be None or an "
+                             f"int > 0")
+        if pruningpolicy not in ('lowestweight', 'leastrecent'):
+            raise ValueError(f"unknown pruning policy '{pruningpolicy}'")
+
+    # parameters that can be set per subject in run_batch
+    _subjectparams = ('shapingthreshold', 'newunitweight', 'forgetweight',
+                      'consolidationweight', 'interferenceweight',
+                      'minperceptsize', 'maxperceptsize', 'maxunits',
+                      'pruningpolicy')
+
+    def _runsequence(self, sequence, perceptsizes=None):
+        """Runs the model on a sequence in the internal representation, and
+        returns the position up to where it has been processed."""
+        self._syncperceptshaper()
+        if perceptsizes is None:
+            perceptsizes = repeat(None)
+        self._settracer()
+        # the input is never copied during the run, steps just advance the
+        # read position
+        end = len(sequence)
+        pos = 0
+        for perceptsize in perceptsizes:
+            if pos >= end:
+                break
+            pos = self._run_step(sequence, nunits=perceptsize, pos=pos)
+        return pos
+
+    def _ownstate(self):
+        """Makes sure that the learned state of the model is not shared with
+        forked models, by copying it if it is. Should be called before
+        changing any of it."""
+        if self._sharedstate[0] == 1:
+            return
+        self._sharedstate[0] -= 1
+        self._sharedstate = [1]
+        self._perceptshaper = dict(self._perceptshaper)
+        self._laststep = dict(self._laststep)
+        self._forgottenprimitives = set(self._forgottenprimitives)
+        self._memoryunits = set(self._memoryunits)
+        self._memoryunitlengths = Counter(self._memoryunitlengths)
+        self._memorytrie = _copytrie(self._memorytrie)
+        primitiveindex = self._primitiveindex
+        self._primitiveindex = defaultdict(dict)
+        for primitive, units in primitiveindex.items():
+            self._primitiveindex[primitive] = dict(units)
+        # the Counters themselves do not change
+        self._unitcounts = dict(self._unitcounts)
+        self._expiryqueue = list(self._expiryqueue)
+        self._thresholdqueue = list(self._thresholdqueue)
+        self._pruningqueue = list(self._pruningqueue)
+        self._lastreinforced = dict(self._lastreinforced)
+        self._pruningstats = dict(self._pruningstats)
+
+    def run_stream(self, chunks, perceptsizes=None):
+        """Run PARSER model instance on a stream of input string chunks,
+        e.g. read from a file or produced by a generator. Chunks are consumed
+        lazily, and only a small lookahead buffer of the input is kept,
+        enough to perceive the longest memory units in one step.
+        Processing the concatenated chunks gives the same results as the
+        `run` method on the full input string.
+
+        This is a generator that yields the percept of every step. Between
+        steps, the model can be inspected, e.g. to take snapshots of the
+        percept shaper.
+
+        Parameters
+        ----------
+        chunks: iterable of str
+            The input string, in consecutive parts of arbitrary length.
+        perceptsizes: iterable of ints or None
+            A sequence of percept sizes that should be used in each step. See
+            `run`.
+
+        Yields
+        ------
+        str
+            The percept of a step.
+
+        Returns
+        -------
+        str
+            Remainder of the buffered input that is not processed. This is
+            empty unless `perceptsizes` is exhausted before the end of the
+            input.
+
+        """
+        if perceptsizes is None:
+            perceptsizes = repeat(None)
+        self._settracer()
+        chunks = iter(chunks)
+        rf = self.readingframe
+        buffer = self._emptyunit
+        pending = '' # incomplete token at end of chunk, when encoding tokens
+        pos = 0
+        exhausted = False
+        for perceptsize in perceptsizes:
+            self._syncperceptshaper()
+            # a step reads no further than nunits times the longest unit
+            nunits = self.maxperceptsize if perceptsize is None \
+                else perceptsize
+            if self._memoryunitlengths:
+                lookahead = nunits * max(self._memoryunitlengths)
             else:
-                perceptsize = None
-            remainder = self._run_step(remainder, nunits=perceptsize)
-        return remainder
+                lookahead = nunits * self._tokenwidth
+            while not exhausted and len(buffer) - pos < lookahead:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    chunk = ''
+                if self._tokencodes is not None:
+                    chunk = pending + chunk
+                    ncomplete = len(chunk) if exhausted \
+                        else len(chunk) - len(chunk) % rf
+                    pending = chunk[ncomplete:]
+                    width = self._tokenwidth
+                    chunk = self._encode(chunk[:ncomplete])
+                    if self._tokenwidth != width:
+                        # token codes were widened; so must be the buffer
+                        buffer = self._recode(buffer[pos:], width)
+                        pos = 0
+                        lookahead = lookahead // width * self._tokenwidth
+                buffer = buffer[pos:] + chunk
+                pos = 0
+            if pos >= len(buffer):
+                break
+            pos = self._run_step(buffer, nunits=perceptsize, pos=pos)
+            yield self._decode(self._emptyunit.join(self._perceivedunits))
+        return self._decode(buffer[pos:]) + pending
+
+    # number of percept sizes that are drawn at once
+    _perceptsizeblocksize = 1024
+
+    def _seedrandom(self, randomseed):
+        """Seeds the random generator, discarding percept sizes that were
+        drawn before."""
+        self._randomseed = randomseed
+        self._random = np.random.default_rng(randomseed)
+        self._perceptsizes = []
+        self._perceptsizepos = 0
+
+    def _drawperceptsize(self):
+        """Returns a random percept size. Sizes are drawn in blocks, which is
+        much faster than drawing them one by one."""
+        if self._perceptsizepos == len(self._perceptsizes):
+            self._perceptsizes = self._random.integers(
+                self.minperceptsize, self.maxperceptsize, endpoint=True,
+                size=self._perceptsizeblocksize).tolist()
+            self._perceptsizepos = 0
+        nunits = self._perceptsizes[self._perceptsizepos]
+        self._perceptsizepos += 1
+        return nunits
 
-    def _run_step(self, inputsequence, nunits=None):
+    def _run_step(self, inputsequence, nunits=None, pos=0):
         """Runs one iteration on the inputsequence, perceiving the first
         random n items (between min_percept_size and max_percept_size),
         and undergoing interference and forgetting. I.e. a step is the
@@ -246,40 +892,57 @@ class PARSER:
 
         Parameters
         ----------
-        inputsequence: str
+        inputsequence: str or bytes
+            The (internal representation of the) input sequence.
+        nunits: int or None
+            The number of units to perceive. If None, this number is drawn
+            randomly.
+        pos: int
+            The position in inputsequence at which the step starts.
 
         Returns
         -------
-        str:
-            remainderstring, what remains after the first part of the
-            inputstring is processed
+        int:
+            The position in inputsequence after the part that is processed
+            in this step.
 
         """
+        self._ownstate()
         self._stepno += 1
-        ps = self.perceptshaper
+        stats = self._stats
+        if stats is not None:
+            stats['nsteps'] += 1
+            self._lapstart = perf_counter()
+        ps = self._perceptshaper
         # clear novelunits and weightdeltas. These keep track of which units
         # are novel in one cycle (step) and of unit weight changes that
         # accumulate over the course of a cycle. These changes do not take
         # effect during the cycle, but only at the end of it.
         self._novelunits = set()
         self._weightdeltas = wd = defaultdict(float)
-        self.logger.info(f'START STEP {self._stepno}\n'
-                         f'\thead of input sequence: {inputsequence[:30]}...\n'
-                         f'\tpercept shaper at start step: {ps}')
+        tracer = self._tracer
+        if tracer is not None:
+            tracer(self, 'startstep', stepno=self._stepno,
+                   inputsequence=inputsequence, pos=pos)
         # step a: select randomly the size of the next percept
         if nunits is None:
-            nunits = self._random.randint(self.minperceptsize,
-                                          self.maxperceptsize)
-        perceivedunits, remainder = self._perceive(nunits, inputsequence)
-        percept = ''.join(perceivedunits)
-        self.logger.info(f'\tpercept: {percept}')
+            nunits = self._drawperceptsize()
+        perceivedunits, pos = self._perceive(nunits, inputsequence, pos)
+        self._perceivedunits = perceivedunits
+        percept = self._emptyunit.join(perceivedunits)
+        if tracer is not None:
+            tracer(self, 'percept', percept=percept)
+        if stats is not None:
+            self._lap('perceivetime')
         # step b:
+        reinforced = [] # units in percept shaper that are strengthened
         if percept in ps:
-            if ps[percept] >= self.shapingthreshold:
+            reinforced.append(percept)
+            if self._weight(percept) >= self.shapingthreshold:
                 wd[percept] += self.consolidationweight
             else:
                 wd[percept] += self.newunitweight
-        elif percept in self.primitives:
+        elif percept in self._primitiveunits:
             if percept not in self._forgottenprimitives:
                 self._novelunits.add(percept)
         else: # new non-primitive percept
@@ -287,32 +950,465 @@ class PARSER:
         if len(perceivedunits) > 1: # add weights to components
             for unit in perceivedunits:
                 if unit in ps:
-                    if ps[unit] >= self.shapingthreshold:
+                    reinforced.append(unit)
+                    if self._weight(unit) >= self.shapingthreshold:
                         wd[unit] += self.consolidationweight
                     else:
                         wd[unit] += self.newunitweight
-                elif (unit in self.primitives) and \
+                elif (unit in self._primitiveunits) and \
                      (unit not in self._forgottenprimitives):
                     self._novelunits.add(unit)
+        if stats is not None:
+            self._lap('strengthentime')
         self._interfere(perceivedunits=perceivedunits)
+        if stats is not None:
+            self._lap('interferetime')
+            stats['nunitscreated'] += len(self._novelunits)
+        self._update()
+        if stats is not None:
+            self._lap('updatetime')
         self._forget()
-        # effectuate all changes at the end of the cycle: changing
-        # weights, removing units, adding units etc.
+        if stats is not None:
+            self._lap('forgettime')
+        if self._maxunits is not None:
+            self._prune(reinforced)
+            if stats is not None:
+                self._lap('prunetime')
+        if tracer is not None:
+            tracer(self, 'endstep', stepno=self._stepno)
+        return pos
+
+    def _update(self):
+        """Effectuates all changes at the end of the cycle: changing
+        weights, removing units, adding units etc. Units that did not change
+        in this cycle are forgotten lazily, by advancing the forgetting clock
+        in _forget."""
+        clock = self._forgetclock + 1
+        recorder = self._recorder
         for unit in self._novelunits:
-            ps[unit] = self.newunitweight
-        for unit, delta in wd.items():
-            ps[unit] += delta
-            if ps[unit] <= 0:
-                self.logger.info(f'\tremoving {unit} with weight <= 0 '
-                                 f'({ps[unit]})')
-                ps.pop(unit)
-                if unit in self.primitives:
-                    self._forgottenprimitives.add(unit)
-        self.logger.info(f'\tpercept shaper at end step: {ps}\n'
-                         f'END STEP')
-        return remainder
-
-    def _perceive(self, nunits, inputsequence):
+            self._indexunit(unit)
+            self._setweight(unit, self.newunitweight, clock)
+            if recorder is not None:
+                recorder._record(self._stepno, unit, recorder._NOVEL,
+                                 self.newunitweight)
+        for unit, delta in self._weightdeltas.items():
+            weight = self._weight(unit) + (delta + self.forgetweight)
+            if weight <= 0:
+                self._removeunit(unit, weight)
+            else:
+                self._setweight(unit, weight, clock)
+                if recorder is not None:
+                    recorder._record(self._stepno, unit, recorder._CHANGE,
+                                     weight)
+
+    def _lap(self, timer):
+        """Adds the time since the previous lap to a timer in stats."""
+        now = perf_counter()
+        self._stats[timer] += now - self._lapstart
+        self._lapstart = now
+
+    def _settracer(self):
+        """Decides which tracer is used during a run. Without a tracer, no
+        trace information is formatted at all."""
+        if self._usertracer is not None:
+            self._tracer = self._usertracer
+        elif self.logger.isEnabledFor(logging.INFO):
+            self._tracer = PARSER._logtrace
+        else:
+            self._tracer = None
+
+    def _logtrace(self, event, **info):
+        """Tracer that writes a trace of the model to its logger."""
+        decode = self._decode
+        if event == 'startstep':
+            sequence = info['inputsequence']
+            pos = info['pos']
+            message = f'START STEP {info["stepno"]}\n' \
+                      f'\thead of input sequence: ' \
+                      f'{decode(sequence[pos:pos + 30])}...\n' \
+                      f'\tpercept shaper at start step: ' \
+                      f'{self._decodedweights()}'
+        elif event == 'percept':
+            message = f'\tpercept: {decode(info["percept"])}'
+        elif event == 'endstep':
+            message = f'\tpercept shaper at end step: ' \
+                      f'{self._decodedweights()}\n' \
+                      f'END STEP'
+        elif event == 'removal':
+            message = f'\tremoving {decode(info["unit"])} with weight <= 0 ' \
+                      f'({info["weight"]})'
+        elif event == 'startperceive':
+            message = '\tSTART PERCEIVE\n' \
+                      f'\t\tmemory units: ' \
+                      f'{[decode(u) for u in info["memoryunits"]]}'
+        elif event == 'endperceive':
+            sequence = info['inputsequence']
+            pos = info['pos']
+            message = f'\t\tperceived units: ' \
+                      f'{[decode(u) for u in info["perceivedunits"]]}\n' \
+                      f'\t\tremainder at end perceive: ' \
+                      f'{decode(sequence[pos:pos + 30])}...\n' \
+                      f'\tEND PERCEIVE'
+        elif event == 'interference':
+            message = f'\t\t{info["ninterferences"]} interferences in ' \
+                      f'{decode(info["unit"])}'
+        else:
+            message = {'startinterfere': '\tSTART INTERFERE',
+                       'endinterfere': '\tEND INTERFERE',
+                       'startforget': '\tSTART FORGET',
+                       'endforget': '\tEND FORGET'}[event]
+        self.logger.info(message)
+
+    def _decodedweights(self):
+        """Dictionary with the current weights of all units in the percept
+        shaper, with decoded units."""
+        return {self._decode(unit): weight
+                for unit, weight in self._currentweights().items()}
+
+    def _encodetoken(self, token):
+        """Returns the code of a token, as bytes. Tokens that have not been
+        seen before get a new code."""
+        code = self._tokencodes.get(token)
+        if code is None:
+            if len(self._tokens) >= 256 ** self._tokenwidth:
+                raise ValueError(f"too many different tokens to encode "
+                                 f"'{token}'")
+            code = len(self._tokens).to_bytes(self._tokenwidth, 'big')
+            self._tokencodes[token] = code
+            self._tokens.append(token)
+        return code
+
+    def _encode(self, s):
+        """Converts a token string to the internal representation of units
+        and input sequences."""
+        if self._tokencodes is None:
+            return s
+        rf = self.readingframe
+        tokens = [s[i:i + rf] for i in range(0, len(s), rf)]
+        ntokens = len(self._tokens) + \
+            len(set(tokens).difference(self._tokencodes))
+        if ntokens > 256 ** self._tokenwidth:
+            self._widentokens(ntokens)
+        encodetoken = self._encodetoken
+        return b''.join([encodetoken(token) for token in tokens])
+
+    def _recode(self, unit, width):
+        """Converts a unit or input sequence encoded with token codes of
+        `width` bytes to the current token width."""
+        tw = self._tokenwidth
+        return b''.join([int.from_bytes(unit[i:i + width], 'big')
+                         .to_bytes(tw, 'big')
+                         for i in range(0, len(unit), width)])
+
+    def _widentokens(self, ntokens):
+        """Widens the token codes, if needed, so that `ntokens` different
+        tokens can be encoded, and re-encodes the state of the model with
+        them. Codes keep their values, so that only their width changes."""
+        width = self._tokenwidth
+        if 256 ** width >= ntokens:
+            return
+        tw = width
+        while 256 ** tw < ntokens:
+            tw *= 2
+        self._tokenwidth = tw
+        def recode(unit):
+            return self._recode(unit, width)
+        # new containers, as tables and state may be shared with forks
+        self._tokencodes = {token: recode(code)
+                            for token, code in self._tokencodes.items()}
+        self._primitiveunits = {recode(u) for u in self._primitiveunits}
+        self._forgottenprimitives = {recode(u)
+                                     for u in self._forgottenprimitives}
+        self._perceptshaper = {recode(u): w
+                               for u, w in self._perceptshaper.items()}
+        self._laststep = {recode(u): c for u, c in self._laststep.items()}
+        self._lastreinforced = {recode(u): c
+                                for u, c in self._lastreinforced.items()}
+        self._perceivedunits = [recode(u) for u in self._perceivedunits]
+        if self._recorder is not None:
+            self._recorder._recode(recode)
+        self._buildindex()
+
+    def _encodeknown(self, s):
+        """Like _encode, but without giving codes to tokens that have not
+        been seen before. Returns a list with the encoded runs of tokens that
+        have a code, and the tokens that have none, as strings, in order."""
+        if self._tokencodes is None:
+            return [s]
+        rf = self.readingframe
+        tokencodes = self._tokencodes
+        parts = []
+        run = []
+        for i in range(0, len(s), rf):
+            token = s[i:i + rf]
+            code = tokencodes.get(token)
+            if code is None:
+                if run:
+                    parts.append(b''.join(run))
+                    run = []
+                parts.append(token)
+            else:
+                run.append(code)
+        if run:
+            parts.append(b''.join(run))
+        return parts
+
+    def _decode(self, unit):
+        """Converts the internal representation of a unit or input sequence
+        back to a token string."""
+        if self._tokencodes is None:
+            return unit
+        tw = self._tokenwidth
+        tokens = self._tokens
+        return ''.join([tokens[int.from_bytes(unit[i:i + tw], 'big')]
+                        for i in range(0, len(unit), tw)])
+
+    def _buildindex(self):
+        """(Re)builds the index of memory units, the primitive index and the
+        forgetting queues from scratch, based on the current percept shaper.
+
+        """
+        self._ownstate()
+        clock = self._forgetclock
+        laststep = self._laststep
+        self._laststep = {unit: laststep.get(unit, clock)
+                          for unit in self._perceptshaper}
+        self._memoryunits.clear()
+        self._memoryunitlengths.clear()
+        self._memorytrie.clear()
+        self._primitiveindex.clear()
+        self._unitcounts.clear()
+        for unit in self._perceptshaper:
+            self._indexunit(unit)
+            self._updateindex(unit, self._weight(unit))
+        self._buildqueues()
+
+    def _buildqueues(self):
+        """(Re)builds the forgetting queues, and the pruning queue, discarding
+        outdated entries."""
+        ps = self._perceptshaper
+        laststep = self._laststep
+        self._pruningqueue = []
+        if self._maxunits is not None:
+            if self._pruningpolicy == 'lowestweight':
+                fw = self.forgetweight
+                # the order of weights does not change by forgetting
+                self._pruningqueue = [(ps[unit] - fw * laststep[unit],
+                                       laststep[unit], unit) for unit in ps]
+            else:
+                lastreinforced = self._lastreinforced
+                self._lastreinforced = {
+                    unit: lastreinforced.get(unit, laststep[unit])
+                    for unit in ps}
+                self._pruningqueue = [(clock, clock, unit) for unit, clock
+                                      in self._lastreinforced.items()]
+            heapify(self._pruningqueue)
+        self._expiryqueue = []
+        self._thresholdqueue = []
+        if self.forgetweight < 0:
+            self._expiryqueue = [(self._crossingclock(unit, 0.),
+                                  laststep[unit], unit) for unit in ps]
+            self._thresholdqueue = [
+                (self._crossingclock(unit, self.shapingthreshold),
+                 laststep[unit], unit) for unit in self._memoryunits]
+        elif self.forgetweight > 0:
+            self._thresholdqueue = [
+                (self._crossingclock(unit, self.shapingthreshold),
+                 laststep[unit], unit) for unit in ps
+                if unit not in self._memoryunits]
+        heapify(self._expiryqueue)
+        heapify(self._thresholdqueue)
+
+    def _weight(self, unit):
+        """Current weight of a unit in the percept shaper."""
+        return self._perceptshaper[unit] + self.forgetweight * \
+               (self._forgetclock - self._laststep[unit])
+
+    def _currentweights(self):
+        """Dictionary with the current weights of all units in the percept
+        shaper."""
+        return {unit: self._weight(unit) for unit in self._perceptshaper}
+
+    def _syncperceptshaper(self):
+        """Takes over the changes that the caller made to the dictionary
+        last handed out by the `perceptshaper` property, if any, and rebuilds
+        the indices. Weights of units that the caller did not change are left
+        as they are, so that merely inspecting the model does not change its
+        results."""
+        if self._exposedweights is None:
+            return
+        weights, original = self._exposedweights
+        self._exposedweights = None
+        if weights == original:
+            return
+        encode = self._encode
+        # new units may have new tokens, and giving codes to them may widen
+        # the token codes; do so before keeping any encoded unit
+        for unit in weights.keys() - original.keys():
+            encode(unit)
+        removed = [encode(unit) for unit in original.keys() - weights.keys()]
+        changed = [(encode(unit), weight) for unit, weight in weights.items()
+                   if unit not in original or original[unit] != weight]
+        self._ownstate()
+        ps = self._perceptshaper
+        laststep = self._laststep
+        clock = self._forgetclock
+        for unit in removed:
+            ps.pop(unit, None)
+            laststep.pop(unit, None)
+            self._lastreinforced.pop(unit, None)
+        for unit, weight in changed:
+            ps[unit] = weight
+            laststep[unit] = clock
+        self._buildindex()
+
+    def _crossingclock(self, unit, level):
+        """The forgetting clock value at which the weight of `unit` will
+        have dropped to `level` or below, if it does not change otherwise.
+        For positive forget weights, the value at which it will have risen
+        above `level`. Not valid for a forget weight of zero.
+
+        """
+        fw = self.forgetweight
+        weight = self._perceptshaper[unit]
+        if fw > 0:
+            n = max(0, math.floor((level - weight) / fw) + 1)
+            while n > 0 and weight + fw * (n - 1) > level:
+                n -= 1
+            while weight + fw * n <= level:
+                n += 1
+            return self._laststep[unit] + n
+        n = max(0, math.ceil((level - weight) / fw))
+        # guard against rounding, so that this corresponds exactly to _weight
+        while n > 0 and weight + fw * (n - 1) <= level:
+            n -= 1
+        while weight + fw * n > level:
+            n += 1
+        return self._laststep[unit] + n
+
+    def _setweight(self, unit, weight, clock):
+        """Sets the weight of `unit`, as it is at forgetting clock value
+        `clock`, and updates the indices accordingly."""
+        self._perceptshaper[unit] = weight
+        self._laststep[unit] = clock
+        if self.forgetweight < 0:
+            heappush(self._expiryqueue,
+                     (self._crossingclock(unit, 0.), clock, unit))
+        self._updateindex(unit, weight)
+        # memory units can fade by forgetting, or other units rise
+        if (self.forgetweight < 0 and unit in self._memoryunits) or \
+                (self.forgetweight > 0 and unit not in self._memoryunits):
+            heappush(self._thresholdqueue,
+                     (self._crossingclock(unit, self.shapingthreshold),
+                      clock, unit))
+        if self._maxunits is not None and \
+                self._pruningpolicy == 'lowestweight':
+            heappush(self._pruningqueue,
+                     (weight - self.forgetweight * clock, clock, unit))
+
+    def _removeunit(self, unit, weight, forget=True):
+        """Removes a unit from the percept shaper. Primitives that are
+        removed are forgotten and do not return, unless `forget` is False."""
+        if self._tracer is not None:
+            self._tracer(self, 'removal', unit=unit, weight=weight)
+        self._perceptshaper.pop(unit)
+        self._laststep.pop(unit)
+        self._lastreinforced.pop(unit, None)
+        self._unindexunit(unit)
+        self._updateindex(unit, 0.)
+        if self._recorder is not None:
+            self._recorder._record(self._stepno, unit,
+                                   self._recorder._REMOVAL, weight)
+        if forget and unit in self._primitiveunits:
+            self._forgottenprimitives.add(unit)
+        if self._stats is not None:
+            self._stats['nunitsremoved'] += 1
+
+    def _prune(self, reinforced):
+        """Prunes units from the percept shaper, according to the pruning
+        policy, as long as it has more than `maxunits` units."""
+        ps = self._perceptshaper
+        queue = self._pruningqueue
+        if self._pruningpolicy == 'lowestweight':
+            check = self._laststep
+        else:
+            check = self._lastreinforced
+            clock = self._forgetclock
+            for unit in chain(self._novelunits, reinforced):
+                if unit in ps:
+                    check[unit] = clock
+                    heappush(queue, (clock, clock, unit))
+        stats = self._pruningstats
+        if len(ps) > self._maxunits:
+            stats['nprunesteps'] += 1
+        while len(ps) > self._maxunits:
+            _, stamp, unit = heappop(queue)
+            if check.get(unit) == stamp:
+                weight = self._weight(unit)
+                self._removeunit(unit, weight, forget=False)
+                stats['npruned'] += 1
+                stats['prunedweight'] += weight
+                stats['maxprunedweight'] = max(stats['maxprunedweight'],
+                                               weight)
+
+    def _indexunit(self, unit):
+        """Decomposes a unit that enters the percept shaper into primitives,
+        and adds it to the primitive index."""
+        self._unitcounts[unit] = counts = Counter(
+            lengthnsubstrings(unit, 1, readingframe=self._tokenwidth))
+        for primitive, count in counts.items():
+            self._primitiveindex[primitive][unit] = count
+
+    def _unindexunit(self, unit):
+        """Removes a unit that leaves the percept shaper from the primitive
+        index, and drops its decomposition."""
+        for primitive in self._unitcounts.pop(unit):
+            units = self._primitiveindex[primitive]
+            del units[unit]
+            if not units:
+                del self._primitiveindex[primitive]
+
+    def _trieinsert(self, unit):
+        """Adds a memory unit to the prefix trie of memory units."""
+        node = self._memorytrie
+        for token in lengthnsubstrings(unit, 1, readingframe=self._tokenwidth):
+            node = node.setdefault(token, {})
+        node[None] = unit
+
+    def _trieremove(self, unit):
+        """Removes a memory unit from the prefix trie of memory units,
+        including nodes that are no longer needed."""
+        path = []
+        node = self._memorytrie
+        for token in lengthnsubstrings(unit, 1, readingframe=self._tokenwidth):
+            path.append((node, token))
+            node = node[token]
+        del node[None]
+        for parent, token in reversed(path):
+            if parent[token]:
+                break
+            del parent[token]
+
+    def _updateindex(self, unit, weight):
+        """Updates the index of memory units for `unit`, which should be
+        called whenever its weight has changed or it has been removed from the
+        percept shaper (in which case weight should be 0).
+
+        """
+        if weight > self.shapingthreshold:
+            if unit not in self._memoryunits:
+                self._memoryunits.add(unit)
+                self._memoryunitlengths[len(unit)] += 1
+                self._trieinsert(unit)
+        elif unit in self._memoryunits:
+            self._memoryunits.remove(unit)
+            self._trieremove(unit)
+            length = len(unit)
+            self._memoryunitlengths[length] -= 1
+            if self._memoryunitlengths[length] == 0:
+                del self._memoryunitlengths[length]
+
+    def _perceive(self, nunits, inputsequence, pos=0):
         """Perceive units from input sequence of primitives.
 
         Private method, normally not to be used by external user. Use the
@@ -324,65 +1420,106 @@ class PARSER:
             The number of units to perceive from the head of the
             inputsequence. A unit is a (usually short, 1-3) sequence of
             primitives.
-        inputsequence: str
-            The sequence of primitives that are perceived. The remainder of
-            the sequence is returned.
+        inputsequence: str or bytes
+            The sequence of primitives that are perceived, in the internal
+            representation.
+        pos: int
+            The position in inputsequence where perception starts.
 
         Returns
         -------
-        tuple (perceived units, remainder of input sequence)
+        tuple (perceived units, position in inputsequence after the
+        perceived units)
 
         """
-        minweight = self.shapingthreshold
-        memoryunits = [unit for unit, weight in self.perceptshaper.items()
-                       if weight > minweight]
-        self.logger.info('\tSTART PERCEIVE\n'
-                         f'\t\tmemory units: {memoryunits}')
-        if memoryunits:
-            maxperceptlength = max(map(len, memoryunits))
-        else:
-            maxperceptlength = self.readingframe
+        tracer = self._tracer
+        if tracer is not None:
+            tracer(self, 'startperceive', memoryunits=self._memoryunits)
+        perceivedunits, pos = self._segment(nunits, inputsequence, pos,
+                                            stats=self._stats)
+        if tracer is not None:
+            tracer(self, 'endperceive', perceivedunits=perceivedunits,
+                   inputsequence=inputsequence, pos=pos)
+        return perceivedunits, pos
+
+    def _segment(self, nunits, inputsequence, pos=0, stats=None):
+        """Segments the head of the input sequence into units, taking the
+        longest memory unit at each position. This is the core of
+        `_perceive`, and does not change the model, except for counting
+        lookups in `stats`, if given.
+
+        Returns
+        -------
+        tuple (units, position in inputsequence after the units)
+
+        """
+        tw = self._tokenwidth
+        root = self._memorytrie
         perceivedunits = []
-        remainder = inputsequence
+        end = len(inputsequence)
+        nscanned = 0
         for i in range(nunits):
-            if maxperceptlength > len(remainder):
-                maxperceptlength = len(remainder)
-            candidate = remainder[:maxperceptlength]
-            while candidate not in memoryunits and len(candidate) > self.readingframe:
-                if candidate in self.primitives:
-                    perceivedunits.append(candidate)
+            if pos >= end:
+                break
+            # walk the trie as far as the input allows, remembering the end
+            # of the longest memory unit on the way
+            node = root
+            unitend = pos + tw
+            walkpos = pos
+            while walkpos < end:
+                node = node.get(inputsequence[walkpos:walkpos + tw])
+                if node is None:
                     break
-                else:
-                    candidate = candidate[:-self.readingframe]
-            remainder = remainder[len(candidate):]
-            if candidate != "":
-                perceivedunits.append(candidate)
-        self.logger.info(f'\t\tperceived units: {perceivedunits}\n'
-                         f'\t\tremainder at end perceive: {remainder[:30]}...\n'
-                         f'\tEND PERCEIVE')
-        return perceivedunits, remainder
+                walkpos += tw
+                if None in node:
+                    unitend = walkpos
+            # matched tokens, plus the lookup that failed, if any
+            nscanned += (walkpos - pos) // tw + (walkpos < end)
+            perceivedunits.append(inputsequence[pos:unitend])
+            pos = min(unitend, end)
+        if stats is not None:
+            stats['nscanned'] += nscanned
+        return perceivedunits, pos
 
     def _interfere(self, perceivedunits):
+        """Decrease the weights of units in the percept shaper that share
+        primitives with the perceived units that are memory units, as
+        defined by the `interferenceweight` parameter of the model.
+
+        The number of interferences in a target unit is the number of
+        occurrences of each of the primitives of the perceived unit in that
+        target, i.e. the dot product of the primitive counts of both units.
+        Only target units that contain at least one of these primitives are
+        visited, by means of the primitive index.
+
+        """
         iw = self.interferenceweight
-        ps = self.perceptshaper
         wd = self._weightdeltas
-        rf = self.readingframe
-        shth = self.shapingthreshold
-        self.logger.info(f'\tSTART INTERFERE')
-        valperceivedunits = [u for u in perceivedunits if u in ps and ps[u] > shth]
-        targets = set(self.perceptshaper.keys()) - self._novelunits
-        self.logger.info(f'\t\ttargets: {targets}')
+        primitiveindex = self._primitiveindex
+        unitcounts = self._unitcounts
+        tracer = self._tracer
+        if tracer is not None:
+            tracer(self, 'startinterfere')
+        valperceivedunits = [u for u in perceivedunits
+                             if u in self._memoryunits]
+        npairs = 0
         for perceivedunit in valperceivedunits:
-            for targetunit in targets:
-                if perceivedunit != targetunit:
-                    iprimitives = lengthnsubstrings(perceivedunit, 1,
-                                                    readingframe=rf)
-                    nmatches = sum(targetunit.count(ip) for ip in iprimitives)
-                    if nmatches > 0:
-                        self.logger.info(f'\t\t{nmatches} interferences in '
-                                         f'{targetunit}')
-                        wd[targetunit] += nmatches * iw
-        self.logger.info(f'\tEND INTERFERE')
+            nmatches = defaultdict(int)
+            for ip, ipcount in unitcounts[perceivedunit].items():
+                for targetunit, count in primitiveindex[ip].items():
+                    nmatches[targetunit] += ipcount * count
+            npairs += len(nmatches)
+            for targetunit, n in nmatches.items():
+                if targetunit != perceivedunit and \
+                        targetunit not in self._novelunits:
+                    if tracer is not None:
+                        tracer(self, 'interference', unit=targetunit,
+                               ninterferences=n)
+                    wd[targetunit] += n * iw
+        if self._stats is not None:
+            self._stats['ninterferencepairs'] += npairs
+        if tracer is not None:
+            tracer(self, 'endinterfere')
 
     def _forget(self):
         """Decrease the weights of non novel units in percept shaper with a
@@ -404,11 +1541,218 @@ class PARSER:
         consisting of multiple primitives (chunks) are also removed, but *can
         return* if they are perceived again.
 
+        Forgetting is not applied to each unit separately. Instead a global
+        forgetting clock is advanced, from which the current weights of
+        units follow. Units that have been changed in the current cycle
+        already have the forget weight included, and are stamped with the new
+        clock value. Units whose weight drops to zero, or below the shaping
+        threshold, are found by means of priority queues.
+
         """
-        self.logger.info(f'\tSTART FORGET')
-        ps = self.perceptshaper
-        wd = self._weightdeltas
-        for unit, weight in list(ps.items()):
-            if unit not in self._novelunits:
-                wd[unit] += self.forgetweight
-        self.logger.info(f'\tEND FORGET')
+        if self._tracer is not None:
+            self._tracer(self, 'startforget')
+        self._forgetclock = clock = self._forgetclock + 1
+        laststep = self._laststep
+        expiryqueue = self._expiryqueue
+        while expiryqueue and expiryqueue[0][0] <= clock:
+            _, stamp, unit = heappop(expiryqueue)
+            if laststep.get(unit) == stamp:
+                self._removeunit(unit, self._weight(unit))
+        thresholdqueue = self._thresholdqueue
+        while thresholdqueue and thresholdqueue[0][0] <= clock:
+            _, stamp, unit = heappop(thresholdqueue)
+            if laststep.get(unit) == stamp:
+                self._updateindex(unit, self._weight(unit))
+        # outdated entries accumulate, clean up now and then
+        maxqueuelength = 4 * len(self._perceptshaper) + 64
+        if len(expiryqueue) > maxqueuelength or \
+                len(thresholdqueue) > maxqueuelength or \
+                len(self._pruningqueue) > maxqueuelength:
+            self._buildqueues()
+        if self._tracer is not None:
+            self._tracer(self, 'endforget')
+
+
+def _copytrie(node):
+    return {key: child if key is None else _copytrie(child)
+            for key, child in node.items()}
+
+
+class BatchResult:
+    """Results of a batch of PARSER models that were run on the same input,
+    in columnar form.
+
+    Parameters
+    ----------
+    perceptshapers: sequence of dicts
+        The percept shaper of each subject at the end of its run.
+    seeds: sequence of ints
+        The random seed of each subject.
+    params: sequence of dicts
+        The model parameters of each subject.
+
+    """
+
+    def __init__(self, perceptshapers, seeds, params):
+        self.seeds = list(seeds)
+        self.params = list(params)
+        self.units = sorted(set().union(*perceptshapers))
+        unitindex = {unit: i for i, unit in enumerate(self.units)}
+        self.weights = np.zeros((len(perceptshapers), len(self.units)))
+        for i, ps in enumerate(perceptshapers):
+            for unit, weight in ps.items():
+                self.weights[i, unitindex[unit]] = weight
+
+    def __str__(self):
+        return f'<BatchResult: {len(self.seeds)} subjects, ' \
+               f'{len(self.units)} units>'
+
+    __repr__ = __str__
+
+    def get_perceptshaper(self, subject):
+        """The percept shaper of a subject, as a dictionary."""
+        return {unit: weight for unit, weight in
+                zip(self.units, self.weights[subject]) if weight != 0.}
+
+    def get_pandasdataframe(self):
+        """Returns a DataFrame with a row per subject, with its seed,
+        parameters and the weights of all units. Weights are 0 for units
+        that are not in the percept shaper of a subject."""
+        df = pd.DataFrame(self.weights, columns=self.units)
+        info = pd.DataFrame(self.params)
+        info.insert(0, 'seed', self.seeds)
+        return pd.concat([info, df], axis=1)
+
+
+class WeightRecorder:
+    """Records how the weights of units in the percept shaper of a PARSER
+    model evolve, in compact columnar buffers.
+
+    Every event is recorded with the step number in which it happens, the
+    unit, the type of event and the weight of the unit after it. Events are
+    'novel' (a unit enters the percept shaper; units that are already in it
+    when the recorder is attached are recorded as novel at that step),
+    'change' (the weight of a unit changes by consolidation or
+    interference) and 'removal' (a unit is removed because its weight
+    dropped to zero or below). Between events, the weight of a unit only
+    decreases by the forget weight of the model in every step, which is not
+    recorded separately, but can be reconstructed by `get_trajectory`.
+
+    Pass a recorder to a PARSER model with the `recorder` parameter. A
+    recorder can only be used for one model.
+
+    """
+
+    _NOVEL, _CHANGE, _REMOVAL = 0, 1, 2
+    eventnames = ('novel', 'change', 'removal')
+
+    def __init__(self):
+        self._steps = array('q')
+        self._unitids = array('q')
+        self._events = array('b')
+        self._weights = array('d')
+        self._unitidmap = {}
+        self._units = []
+        self._decode = None
+        self.forgetweight = None
+
+    def __str__(self):
+        return f'<WeightRecorder: {len(self)} events, ' \
+               f'{len(self._units)} units>'
+
+    __repr__ = __str__
+
+    def __len__(self):
+        return len(self._steps)
+
+    def _attach(self, model):
+        if self._decode is not None:
+            raise ValueError("recorder is already used by another model")
+        self._decode = model._decode
+        self.forgetweight = model.forgetweight
+        for unit in model._perceptshaper:
+            self._record(model._stepno, unit, self._NOVEL,
+                         model._weight(unit))
+
+    def _recode(self, recode):
+        # the model widened its token codes
+        self._units = [recode(unit) for unit in self._units]
+        self._unitidmap = {unit: i for i, unit in enumerate(self._units)}
+
+    def _record(self, step, unit, event, weight):
+        unitid = self._unitidmap.get(unit)
+        if unitid is None:
+            unitid = self._unitidmap[unit] = len(self._units)
+            self._units.append(unit)
+        self._steps.append(step)
+        self._unitids.append(unitid)
+        self._events.append(event)
+        self._weights.append(weight)
+
+    @property
+    def units(self):
+        """List of all units that were recorded, in order of first
+        appearance. Unit ids in the recorded data index this list."""
+        return [self._decode(unit) for unit in self._units]
+
+    def get_arrays(self):
+        """Returns the recorded data as a dictionary of numpy arrays: 'step',
+        'unitid', 'event' (0: novel, 1: change, 2: removal) and 'weight'.
+        The arrays share memory with the recorder's buffers."""
+        return {'step': np.frombuffer(self._steps, dtype=np.int64),
+                'unitid': np.frombuffer(self._unitids, dtype=np.int64),
+                'event': np.frombuffer(self._events, dtype=np.int8),
+                'weight': np.frombuffer(self._weights, dtype=np.float64)}
+
+    def get_pandasdataframe(self):
+        """Returns a DataFrame with a row per event, with columns 'step',
+        'unit', 'event' and 'weight'."""
+        arrays = self.get_arrays()
+        units = np.array(self.units, dtype=object)
+        return pd.DataFrame({
+            'step': arrays['step'],
+            'unit': units[arrays['unitid']] if len(units) else [],
+            'event': pd.Categorical.from_codes(arrays['event'],
+                                               categories=self.eventnames),
+            'weight': arrays['weight']})
+
+    def get_trajectory(self, unit, laststep=None):
+        """The weight of `unit` in every step, from its first appearance in
+        the percept shaper up to `laststep`, including forgetting.
+
+        Parameters
+        ----------
+        unit: str
+            The unit.
+        laststep: int or None
+            The last step of the trajectory. Defaults to the last recorded
+            step.
+
+        Returns
+        -------
+        tuple of arrays (steps, weights)
+            Weights are NaN in steps where the unit is not in the percept
+            shaper.
+
+        """
+        arrays = self.get_arrays()
+        if laststep is None:
+            laststep = int(arrays['step'][-1]) if len(self) else 0
+        unitid = self.units.index(unit)
+        mask = arrays['unitid'] == unitid
+        steps, events, weights = (arrays['step'][mask], arrays['event'][mask],
+                                  arrays['weight'][mask])
+        allsteps = np.arange(steps[0], laststep + 1)
+        # index of the last event at or before each step
+        eventindex = np.searchsorted(steps, allsteps, side='right') - 1
+        trajectory = weights[eventindex] + \
+                     self.forgetweight * (allsteps - steps[eventindex])
+        trajectory[events[eventindex] == self._REMOVAL] = np.nan
+        return allsteps, trajectory
+
+    def save(self, filename):
+        """Saves the recorded data to a numpy `.npz` file, with the arrays
+        of `get_arrays`, and the units."""
+        np.savez_compressed(filename, units=np.array(self.units, dtype=str),
+                            forgetweight=self.forgetweight,
+                            **self.get_arrays())
@@ -3,6 +3,8 @@ from . import strcomp
 from . import strsetcomp
 from . import htmltables
 from . import PARSER
+from . import parsersweep
+from . import parsermatrix
 
 from ._version import get_versions
 __version__ = get_versions()['version']
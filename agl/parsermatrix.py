@@ -0,0 +1,321 @@
+"""A PARSER model with vectorized interference, weight updates and
+forgetting.
+
+The `MatrixPARSER` model keeps the weights of the units in the percept shaper
+in arrays, one row per unit, so that the weight changes at the end of a step,
+forgetting and pruning are array operations on all units at once, instead of
+loops over units. For interference, each primitive has an array of the rows
+of the units that contain it and an array of their counts in those units,
+i.e. a sparse, column-wise unit x primitive count matrix. The number of
+interferences between a perceived unit and each unit in the percept shaper
+then follows from the columns of the primitives of the perceived unit only.
+
+Vectorizing pays off when many units change in a step, as with a few
+primitives that occur in most units. With a large vocabulary of primitives,
+where each unit shares primitives with few others, the dictionary based
+`PARSER` is faster.
+
+Results are identical to those of `PARSER`.
+
+"""
+
+import numpy as np
+
+from collections import Counter
+from itertools import chain, repeat
+
+from .PARSER import PARSER
+from .strfuncs import lengthnsubstrings
+
+__all__ = ['MatrixPARSER']
+
+
+class MatrixPARSER(PARSER):
+    """PARSER model that keeps the weights of the percept shaper in arrays,
+    on which the weight changes at the end of a step, forgetting and pruning
+    are vectorized, and that computes interference from per primitive arrays
+    of unit rows and counts. It takes the same parameters as `PARSER`, and
+    gives the same results.
+
+    The percept shaper dictionary is kept up to date as well, so that the
+    model can be used and inspected exactly like `PARSER`. Each row of the
+    arrays holds one unit; rows of removed units are reused.
+
+    """
+
+    # initial number of rows of the arrays; it doubles when needed
+    _initialrows = 64
+
+    def _buildindex(self):
+        nrows = self._initialrows
+        # weights as at the forgetting clock values in stamps, see _weight
+        self._baseweights = np.zeros(nrows, dtype=np.float64)
+        self._stamps = np.zeros(nrows, dtype=np.int64)
+        self._reinforcedclocks = np.zeros(nrows, dtype=np.int64)
+        self._activerows = np.zeros(nrows, dtype=bool)
+        self._memoryrows = np.zeros(nrows, dtype=bool)
+        # primitive -> [rows of the units with the primitive, its counts in
+        # them, number of units]; the arrays have room to grow
+        self._primitivecolumns = {}
+        self._unitrows = {} # unit -> row
+        self._rowunits = [None] * nrows # row -> unit or None
+        self._freerows = list(range(nrows - 1, -1, -1))
+        super()._buildindex()
+        ps = self._perceptshaper
+        laststep = self._laststep
+        lastreinforced = self._lastreinforced
+        for unit, row in self._unitrows.items():
+            self._baseweights[row] = ps[unit]
+            self._stamps[row] = laststep[unit]
+            self._reinforcedclocks[row] = lastreinforced.get(unit, 0)
+
+    def _buildqueues(self):
+        # forgetting and pruning do not need queues
+        if self._maxunits is not None and \
+                self._pruningpolicy == 'leastrecent':
+            lastreinforced = self._lastreinforced
+            self._lastreinforced = {
+                unit: lastreinforced.get(unit, self._laststep[unit])
+                for unit in self._perceptshaper}
+
+    def _ownstate(self):
+        if self._sharedstate[0] == 1:
+            return
+        super()._ownstate()
+        self._baseweights = self._baseweights.copy()
+        self._stamps = self._stamps.copy()
+        self._reinforcedclocks = self._reinforcedclocks.copy()
+        self._activerows = self._activerows.copy()
+        self._memoryrows = self._memoryrows.copy()
+        self._primitivecolumns = {
+            primitive: [rows.copy(), counts.copy(), n]
+            for primitive, (rows, counts, n)
+            in self._primitivecolumns.items()}
+        self._unitrows = dict(self._unitrows)
+        self._rowunits = list(self._rowunits)
+        self._freerows = list(self._freerows)
+
+    def _growarrays(self, nrows):
+        """Enlarges the arrays to the given number of rows."""
+        oldnrows = len(self._baseweights)
+        for name in ('_baseweights', '_stamps', '_reinforcedclocks',
+                     '_activerows', '_memoryrows'):
+            array = getattr(self, name)
+            newarray = np.zeros(nrows, dtype=array.dtype)
+            newarray[:oldnrows] = array
+            setattr(self, name, newarray)
+        self._rowunits.extend([None] * (nrows - oldnrows))
+        self._freerows.extend(range(nrows - 1, oldnrows - 1, -1))
+
+    def _indexunit(self, unit):
+        """Decomposes a unit that enters the percept shaper into primitives,
+        gives it a row, and adds the row to the columns of its
+        primitives."""
+        self._unitcounts[unit] = unitcounts = Counter(
+            lengthnsubstrings(unit, 1, readingframe=self._tokenwidth))
+        if not self._freerows:
+            self._growarrays(2 * len(self._baseweights))
+        row = self._freerows.pop()
+        self._unitrows[unit] = row
+        self._rowunits[row] = unit
+        self._activerows[row] = True
+        columns = self._primitivecolumns
+        for primitive, count in unitcounts.items():
+            column = columns.get(primitive)
+            if column is None:
+                column = columns[primitive] = [
+                    np.empty(4, dtype=np.int64), np.empty(4, dtype=np.int32),
+                    0]
+            rows, counts, n = column
+            if n == len(rows):
+                column[0] = rows = np.resize(rows, 2 * n)
+                column[1] = counts = np.resize(counts, 2 * n)
+            rows[n] = row
+            counts[n] = count
+            column[2] = n + 1
+
+    def _unindexunit(self, unit):
+        """Frees the row of a unit that leaves the percept shaper, removes it
+        from the columns of its primitives, and drops its decomposition."""
+        row = self._unitrows.pop(unit)
+        columns = self._primitivecolumns
+        for primitive in self._unitcounts.pop(unit):
+            column = columns[primitive]
+            rows, counts, n = column
+            n -= 1
+            if n == 0:
+                del columns[primitive]
+                continue
+            # the last entry takes the place of the removed one
+            i = int(np.flatnonzero(rows[:n + 1] == row)[0])
+            rows[i] = rows[n]
+            counts[i] = counts[n]
+            column[2] = n
+        self._activerows[row] = False
+        self._memoryrows[row] = False
+        self._rowunits[row] = None
+        self._freerows.append(row)
+
+    def _updateindex(self, unit, weight):
+        super()._updateindex(unit, weight)
+        row = self._unitrows.get(unit)
+        if row is not None:
+            self._memoryrows[row] = weight > self.shapingthreshold
+
+    def _setweight(self, unit, weight, clock):
+        """Sets the weight of `unit`, as it is at forgetting clock value
+        `clock`, and updates the indices accordingly."""
+        self._perceptshaper[unit] = weight
+        self._laststep[unit] = clock
+        row = self._unitrows[unit]
+        self._baseweights[row] = weight
+        self._stamps[row] = clock
+        self._updateindex(unit, weight)
+
+    def _interfere(self, perceivedunits):
+        """Decrease the weights of units in the percept shaper that share
+        primitives with the perceived units that are memory units, as
+        defined by the `interferenceweight` parameter of the model.
+
+        The numbers of interferences in all units follow from the row and
+        count arrays of the primitives of a perceived unit, summed per row.
+        They are added to a vector of weight changes, which starts with the
+        weight changes of step b of the cycle.
+
+        """
+        iw = self.interferenceweight
+        unitrows = self._unitrows
+        primitivecolumns = self._primitivecolumns
+        tracer = self._tracer
+        if tracer is not None:
+            tracer(self, 'startinterfere')
+        nrows = len(self._baseweights)
+        self._deltas = deltas = np.zeros(nrows, dtype=np.float64)
+        self._touched = touched = np.zeros(nrows, dtype=bool)
+        for unit, delta in self._weightdeltas.items():
+            row = unitrows[unit]
+            deltas[row] = delta
+            touched[row] = True
+        valperceivedunits = [u for u in perceivedunits
+                             if u in self._memoryunits]
+        npairs = 0
+        for perceivedunit in valperceivedunits:
+            counts = self._unitcounts[perceivedunit]
+            columns = [primitivecolumns[p] for p in counts]
+            nmatches = np.bincount(
+                np.concatenate([rows[:n] for rows, _, n in columns]),
+                weights=np.concatenate([c[:n] * count for (_, c, n), count
+                                        in zip(columns, counts.values())]),
+                minlength=nrows)
+            if self._stats is not None:
+                npairs += np.count_nonzero(nmatches)
+            nmatches[unitrows[perceivedunit]] = 0.
+            if tracer is not None:
+                for row in np.flatnonzero(nmatches).tolist():
+                    tracer(self, 'interference', unit=self._rowunits[row],
+                           ninterferences=int(nmatches[row]))
+            deltas += nmatches * iw
+            touched |= nmatches > 0.
+        if self._stats is not None:
+            self._stats['ninterferencepairs'] += npairs
+        if tracer is not None:
+            tracer(self, 'endinterfere')
+
+    def _update(self):
+        """Effectuates all changes at the end of the cycle, for all changed
+        units at once."""
+        fw = self.forgetweight
+        clock = self._forgetclock + 1
+        recorder = self._recorder
+        rows = np.flatnonzero(self._touched)
+        weights = self._baseweights[rows] + \
+            fw * (self._forgetclock - self._stamps[rows]) + \
+            (self._deltas[rows] + fw)
+        for unit in self._novelunits:
+            self._indexunit(unit)
+            self._setweight(unit, self.newunitweight, clock)
+            if recorder is not None:
+                recorder._record(self._stepno, unit, recorder._NOVEL,
+                                 self.newunitweight)
+        removed = weights <= 0.
+        if removed.any():
+            for row, weight in zip(rows[removed].tolist(),
+                                   weights[removed].tolist()):
+                self._removeunit(self._rowunits[row], weight)
+            rows = rows[~removed]
+            weights = weights[~removed]
+        self._baseweights[rows] = weights
+        self._stamps[rows] = clock
+        units = [self._rowunits[row] for row in rows.tolist()]
+        weightlist = weights.tolist()
+        self._perceptshaper.update(zip(units, weightlist))
+        self._laststep.update(zip(units, repeat(clock)))
+        changed = (weights > self.shapingthreshold) != self._memoryrows[rows]
+        for i in np.flatnonzero(changed).tolist():
+            self._updateindex(units[i], weightlist[i])
+        if recorder is not None:
+            for unit, weight in zip(units, weightlist):
+                recorder._record(self._stepno, unit, recorder._CHANGE,
+                                 weight)
+
+    def _forget(self):
+        """Advances the forgetting clock, removes the units whose weight
+        has dropped to zero or below, and updates the index of memory units
+        for units whose weight crossed the shaping threshold, by evaluating
+        the weights of all units at once.
+
+        """
+        if self._tracer is not None:
+            self._tracer(self, 'startforget')
+        self._forgetclock = clock = self._forgetclock + 1
+        fw = self.forgetweight
+        if fw != 0:
+            weights = self._baseweights + fw * (clock - self._stamps)
+            if fw < 0:
+                expired = np.flatnonzero(self._activerows & (weights <= 0.))
+                for row in expired.tolist():
+                    self._removeunit(self._rowunits[row],
+                                     float(weights[row]))
+            crossed = np.flatnonzero(
+                self._activerows &
+                ((weights > self.shapingthreshold) != self._memoryrows))
+            for row in crossed.tolist():
+                self._updateindex(self._rowunits[row], float(weights[row]))
+        if self._tracer is not None:
+            self._tracer(self, 'endforget')
+
+    def _prune(self, reinforced):
+        """Prunes units from the percept shaper, according to the pruning
+        policy, as long as it has more than `maxunits` units."""
+        ps = self._perceptshaper
+        if self._pruningpolicy == 'leastrecent':
+            clock = self._forgetclock
+            for unit in chain(self._novelunits, reinforced):
+                if unit in ps:
+                    self._lastreinforced[unit] = clock
+                    self._reinforcedclocks[self._unitrows[unit]] = clock
+        excess = len(ps) - self._maxunits
+        if excess <= 0:
+            return
+        rows = np.flatnonzero(self._activerows)
+        if self._pruningpolicy == 'lowestweight':
+            stamps = self._stamps[rows]
+            keys = self._baseweights[rows] - self.forgetweight * stamps
+        else:
+            stamps = keys = self._reinforcedclocks[rows]
+        # the units with the lowest keys, with ties resolved as in PARSER
+        if excess < len(rows):
+            candidates = keys <= np.partition(keys, excess - 1)[excess - 1]
+            rows = rows[candidates]
+            keys = keys[candidates]
+            stamps = stamps[candidates]
+        pruned = sorted(zip(keys.tolist(), stamps.tolist(),
+                            [self._rowunits[row] for row in rows.tolist()]))
+        stats = self._pruningstats
+        stats['nprunesteps'] += 1
+        for _, _, unit in pruned[:excess]:
+            weight = self._weight(unit)
+            self._removeunit(unit, weight, forget=False)
+            stats['npruned'] += 1
+            stats['prunedweight'] += weight
+            stats['maxprunedweight'] = max(stats['maxprunedweight'], weight)
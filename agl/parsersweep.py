@@ -0,0 +1,131 @@
+"""Parameter sweeps of the PARSER model, run in parallel processes.
+
+Every combination of parameter set and random seed is an independent job.
+Jobs are spread across a pool of worker processes. The input string is
+placed in shared memory once, from which each worker reads it when it
+starts, so that it is not sent along with every job. Shared memory needs
+Python 3.8 or later; the rest of the package does not, so this module only
+imports it when a sweep runs.
+
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from .PARSER import PARSER, BatchResult
+
+__all__ = ['parametergrid', 'sweep']
+
+
+def parametergrid(**params):
+    """Returns a list with all combinations of parameter values.
+
+    Parameters
+    ----------
+    params:
+        Parameter names with a sequence of values for each.
+
+    Returns
+    -------
+    list of dicts
+
+    Examples
+    --------
+    >>> from agl.parsersweep import parametergrid
+    >>> parametergrid(forgetweight=[-0.05, -0.1], maxperceptsize=[3])
+    [{'forgetweight': -0.05, 'maxperceptsize': 3}, {'forgetweight': -0.1, 'maxperceptsize': 3}]
+
+    """
+    names = list(params)
+    return [dict(zip(names, values))
+            for values in itertools.product(*params.values())]
+
+
+# state of a worker process, set by _initworker
+_worker = {}
+
+
+def _initworker(shmname, nbytes, primitives, kwargs):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shmname)
+    try:
+        _worker['inputstring'] = bytes(shm.buf[:nbytes]).decode('utf-8')
+    finally:
+        shm.close()
+    _worker['primitives'] = primitives
+    _worker['kwargs'] = kwargs
+
+
+def _runjob(job):
+    params, seed = job
+    model = PARSER(_worker['primitives'], randomseed=seed,
+                   **_worker['kwargs'], **params)
+    model.run(_worker['inputstring'])
+    return model.perceptshaper
+
+
+def sweep(inputstring, primitives, paramsets, seeds, nprocesses=None,
+          **kwargs):
+    """Runs PARSER for every combination of a parameter set and a random
+    seed, in a pool of worker processes. Requires Python 3.8 or later.
+
+    Parameters
+    ----------
+    inputstring: str
+        The string of tokens to run the models on.
+    primitives: list
+        List of primitives from which words are build.
+    paramsets: sequence of dicts
+        The parameter sets to run, e.g. as generated by `parametergrid`.
+        Parameters that can be varied are `shapingthreshold`,
+        `newunitweight`, `forgetweight`, `consolidationweight`,
+        `interferenceweight`, `minperceptsize`, `maxperceptsize`,
+        `maxunits` and `pruningpolicy`.
+    seeds: int or sequence of ints
+        The random seeds with which each parameter set is run. If an int
+        n, the seeds 0 to n-1 are used. Each job has its own seed, so that
+        results do not depend on the number of processes or on the order in
+        which jobs are done.
+    nprocesses: int or None
+        The number of worker processes. If None, the number of processors
+        on the machine is used.
+    kwargs:
+        Other parameters of the PARSER models, common to all jobs, such as
+        `readingframe`.
+
+    Returns
+    -------
+    pandas DataFrame
+        A row per job, with its seed, parameters, and the weights of all
+        units at the end of the run.
+
+    """
+    from multiprocessing import shared_memory
+    if isinstance(seeds, int):
+        seeds = range(seeds)
+    for p in paramsets:
+        invalid = set(p) - set(PARSER._subjectparams)
+        if invalid:
+            raise ValueError(f"parameters {invalid} cannot be varied in a "
+                             f"sweep")
+        PARSER._checkparams(**p)
+    jobs = [(p, seed) for p in paramsets for seed in seeds]
+    data = inputstring.encode('utf-8')
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    try:
+        shm.buf[:len(data)] = data
+        with ProcessPoolExecutor(max_workers=nprocesses,
+                                 initializer=_initworker,
+                                 initargs=(shm.name, len(data),
+                                           list(primitives),
+                                           kwargs)) as executor:
+            perceptshapers = list(executor.map(_runjob, jobs))
+    finally:
+        shm.close()
+        shm.unlink()
+    defaults = PARSER(primitives, **kwargs)
+    params = [{name: p.get(name, getattr(defaults, name))
+               for name in PARSER._subjectparams} for p, _ in jobs]
+    result = BatchResult(perceptshapers=perceptshapers,
+                         seeds=[seed for _, seed in jobs], params=params)
+    return result.get_pandasdataframe()
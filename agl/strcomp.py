@@ -59,17 +59,30 @@ def sharedlengthnsubstrings(s1, s2, n, readingframe=1):
     checkstring(s2, readingframe=readingframe)
     checkpositiveint(n)
     s1ss = lengthnsubstrings(s1, n=n, readingframe=readingframe)
+    s2index = _lengthnsubstringindex(s2, n=n, readingframe=readingframe)
     matches = []
     for pos, substring in enumerate(s1ss):
-        positions = []
-        for i in range(0, len(s2), readingframe):
-            if substring == s2[i:i + n * readingframe]:
-                positions.append((pos, int(i/readingframe)))
-        if len(positions) > 0:
-            matches.append((substring, tuple(positions)))
+        s2positions = s2index.get(substring)
+        if s2positions is not None:
+            matches.append((substring,
+                            tuple((pos, pos2) for pos2 in s2positions)))
     return tuple(matches)
 
 
+def _lengthnsubstringindex(s, n, readingframe=1):
+    """Returns a dictionary that maps each length-n substring of s to a list
+    of the token positions at which it occurs, in increasing order."""
+    index = {}
+    for pos, substring in enumerate(lengthnsubstrings(
+            s, n=n, readingframe=readingframe)):
+        positions = index.get(substring)
+        if positions is None:
+            index[substring] = [pos]
+        else:
+            positions.append(pos)
+    return index
+
+
 def sharedsubstrings(s1, s2, readingframe=1):
     """
     Finds all possible shared substrings of s1 in s2.
@@ -145,11 +158,69 @@ def longestsharedsubstrings(s1, s2, readingframe=1):
     (('a1a2', ((0, 2),)),)
     
     """
-    for n in range(len(s1)//readingframe, 0, -1):
-        matches = sharedlengthnsubstrings(s1, s2, n, readingframe)
-        if matches:
-            return matches
-    return ()
+    n = _longestsharedlength(s1, s2, readingframe)
+    if n == 0:
+        return ()
+    return sharedlengthnsubstrings(s1, s2, n, readingframe)
+
+
+def _suffixautomaton(tokens):
+    """Builds the suffix automaton of a sequence of tokens, which recognizes
+    exactly its substrings, in linear time. Returns, per state, a dictionary
+    of transitions (token -> state), the suffix link, and the length of the
+    longest substring that ends in the state. State 0 is the start state."""
+    transitions = [{}]
+    links = [-1]
+    lengths = [0]
+    last = 0
+    for token in tokens:
+        state = len(lengths)
+        transitions.append({})
+        links.append(0)
+        lengths.append(lengths[last] + 1)
+        p = last
+        while p != -1 and token not in transitions[p]:
+            transitions[p][token] = state
+            p = links[p]
+        if p != -1:
+            q = transitions[p][token]
+            if lengths[p] + 1 == lengths[q]:
+                links[state] = q
+            else:
+                clone = len(lengths)
+                transitions.append(dict(transitions[q]))
+                links.append(links[q])
+                lengths.append(lengths[p] + 1)
+                while p != -1 and transitions[p].get(token) == q:
+                    transitions[p][token] = clone
+                    p = links[p]
+                links[q] = links[state] = clone
+        last = state
+    return transitions, links, lengths
+
+
+def _longestsharedlength(s1, s2, readingframe=1):
+    """Returns the length, in tokens, of the longest substrings of s1 that
+    occur in s2, in time linear in the lengths of s1 and s2, by running the
+    tokens of s1 through the suffix automaton of s2."""
+    if len(s1) // readingframe == 0:
+        return 0
+    checkpositiveint(readingframe)
+    checkstring(s1, readingframe=readingframe)
+    checkstring(s2, readingframe=readingframe)
+    if readingframe > 1:
+        s1 = lengthnsubstrings(s1, n=1, readingframe=readingframe)
+        s2 = lengthnsubstrings(s2, n=1, readingframe=readingframe)
+    transitions, links, lengths = _suffixautomaton(s2)
+    state = length = longest = 0
+    for token in s1:
+        while state and token not in transitions[state]:
+            state = links[state]
+            length = lengths[state]
+        state = transitions[state].get(token, 0)
+        length = length + 1 if state else 0
+        longest = max(longest, length)
+    return longest
 
 
 def longestsharedsubstringlength(s1, s2, readingframe=1):
@@ -184,11 +255,7 @@ def longestsharedsubstringlength(s1, s2, readingframe=1):
     2
 
     """
-    items = longestsharedsubstrings(s1=s1, s2=s2, readingframe=readingframe)
-    if items:
-        return int(len(items[0][0]) / readingframe)
-    else:
-        return 0
+    return _longestsharedlength(s1, s2, readingframe=readingframe)
 
 
 def longestsharedsubstringduration(s1, s2, tokendurations, isiduration,
@@ -1,13 +1,144 @@
-from functools import lru_cache
+import numpy as np
+from collections import OrderedDict, namedtuple
 
 __all__ = ['lengthnsubstrings', 'substrings', 'lengthnhead',
-           'lengthntail', 'lengthnanchors', 'heads', 'tails', 'anchors']
+           'lengthntail', 'lengthnanchors', 'heads', 'tails', 'anchors',
+           'cacheinfo', 'clearcache', 'setcachesize', 'SubstringView',
+           'lengthnsubstringview', 'substringview', 'rollinghash',
+           'ilengthnsubstrings', 'isubstrings', 'iheads', 'itails',
+           'ianchors']
+
+# The decompositions of strings into substrings are memoized in caches at
+# module level, shared by all callers, that are bounded by the total length
+# of the strings they hold. See setcachesize, cacheinfo and clearcache.
+defaultcachesize = 2 ** 20
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _SubstringCache:
+    """Least recently used cache of a function that returns a tuple of
+    strings, bounded by the total length of the cached strings, i.e. of
+    the results and of the strings they were computed from. Results that
+    are larger than the bound are not cached. Like a function wrapped
+    in `functools.lru_cache`, it raises a TypeError for unhashable
+    arguments."""
+
+    def __init__(self, func, maxsize):
+        self._func = func
+        self._maxsize = maxsize
+        self._results = OrderedDict() # arguments -> (result, size)
+        self._size = 0
+        self._hits = self._misses = 0
+
+    def __call__(self, *args):
+        results = self._results
+        item = results.get(args)
+        if item is not None:
+            results.move_to_end(args)
+            self._hits += 1
+            return item[0]
+        self._misses += 1
+        result = self._func(*args)
+        maxsize = self._maxsize
+        if maxsize == 0:
+            return result
+        size = len(args[0]) + sum(map(len, result))
+        if maxsize is None or size <= maxsize:
+            results[args] = (result, size)
+            self._size += size
+            while maxsize is not None and self._size > maxsize:
+                _, (_, oldsize) = results.popitem(last=False)
+                self._size -= oldsize
+        return result
+
+    def cache_info(self):
+        return CacheInfo(self._hits, self._misses, self._maxsize, self._size)
+
+    def cache_clear(self):
+        self._results.clear()
+        self._size = 0
+        self._hits = self._misses = 0
+
+
+def _lengthnsubstrings(s, n, readingframe):
+    return tuple(ilengthnsubstrings(s, n, readingframe=readingframe))
+
+
+def _substrings(s, minlength, maxlength, readingframe):
+    if maxlength is None:
+        maxlength = int(len(s) / readingframe)
+    ss = []
+    for n in range(minlength, maxlength + 1):
+        ss.extend(ilengthnsubstrings(s, n=n, readingframe=readingframe))
+    return tuple(ss)
+
+
+def setcachesize(maxsize=defaultcachesize):
+    """
+    Sets how much is memoized, per function, as the total length of the
+    cached strings. This empties the caches.
+
+    Parameters
+    ----------
+    maxsize : non-negative int or None, default `defaultcachesize`
+        The maximum total length, in characters, of the cached results of
+        each of `lengthnsubstrings` and `substrings`, and of the strings
+        they were computed from.
+        When a cache is full, the least recently used results are
+        discarded. Results that are larger than maxsize are not cached. If
+        0, nothing is cached; if None, caches are unbounded.
+
+    """
+    global _cachedlengthnsubstrings, _cachedsubstrings
+    _cachedlengthnsubstrings = _SubstringCache(_lengthnsubstrings, maxsize)
+    _cachedsubstrings = _SubstringCache(_substrings, maxsize)
+
+
+setcachesize()
+
+
+def cacheinfo():
+    """
+    Returns statistics of the caches of `lengthnsubstrings` and
+    `substrings`.
+
+    Returns
+    -------
+    dict with function names as keys and named tuples (hits, misses,
+    maxsize, currsize) as values, in which sizes are total lengths of
+    cached strings
+
+    Examples
+    --------
+    >>> from agl.strfuncs import cacheinfo, clearcache, lengthnsubstrings
+    >>> clearcache()
+    >>> s = lengthnsubstrings('abcd', n=2)
+    >>> s = lengthnsubstrings('abcd', n=2)
+    >>> cacheinfo()['lengthnsubstrings']
+    CacheInfo(hits=1, misses=1, maxsize=1048576, currsize=10)
+
+    """
+    return {'lengthnsubstrings': _cachedlengthnsubstrings.cache_info(),
+            'substrings': _cachedsubstrings.cache_info()}
+
+
+def clearcache():
+    """
+    Empties the caches of `lengthnsubstrings` and `substrings`, and resets
+    their statistics.
+
+    """
+    _cachedlengthnsubstrings.cache_clear()
+    _cachedsubstrings.cache_clear()
 
 
 def lengthnsubstrings(s, n, readingframe=1):
     """
     Returns a tuple of consecutive length-n substrings of s.
 
+    Results are memoized, see `setcachesize`.
+
     Parameters
     ----------
     s : string
@@ -34,23 +165,18 @@ def lengthnsubstrings(s, n, readingframe=1):
     ('a1a2a3c1', 'a2a3c1b3', 'a3c1b3b2', 'c1b3b2b1')
 
     """
-    #separate function so that we can memoize and still have docstring
-    @lru_cache(maxsize=512)
-    def _lengthnsubstrings(s, n, readingframe=1):
-        # how many length-n substrings exist in in s?
-        nss = int(len(s) / readingframe) - n + 1
-        nglyphs = n * readingframe
-        return tuple(s[i:i + nglyphs] for i in range(0, nss * readingframe,
-                                               readingframe))
-
-    return _lengthnsubstrings(s=s, n=n, readingframe=readingframe)
+    try:
+        return _cachedlengthnsubstrings(s, n, readingframe)
+    except TypeError: # s is not hashable, e.g. a list
+        return _lengthnsubstrings(s, n, readingframe)
 
 
 def substrings(s, minlength=1, maxlength=None, readingframe=1):
     """
     Returns a tuple of all consecutive substrings of s.
 
-    Note that this includes the full string itself.
+    Note that this includes the full string itself. Results are memoized,
+    see `setcachesize`.
 
     Parameters
     ----------
@@ -80,17 +206,271 @@ def substrings(s, minlength=1, maxlength=None, readingframe=1):
     ('cd', 'ef', 'cdef')
 
     """
+    try:
+        return _cachedsubstrings(s, minlength, maxlength, readingframe)
+    except TypeError: # s is not hashable, e.g. a list
+        return _substrings(s, minlength, maxlength, readingframe)
+
+# Rolling hashes are polynomial hashes of the character codes of a string,
+# modulo two primes below 2**31, combined into one 62-bit integer, so that
+# all arithmetic fits in 64 bits. The hash of a substring follows from prefix
+# sums in constant time.
+_hashmoduli = (2147483647, 2147483629)
+_hashbases = (911382323, 972663749)
+
+
+def _charcodes(s):
+    """Character codes of a str or bytes object, plus 1 so that no code is
+    zero, as uint64 array."""
+    if isinstance(s, str):
+        codes = np.frombuffer(s.encode('utf-32-le'), dtype='<u4')
+    elif isinstance(s, (bytes, bytearray)):
+        codes = np.frombuffer(s, dtype=np.uint8)
+    else:
+        raise TypeError(f"rolling hashes need a str or bytes object, not "
+                        f"{type(s).__name__}")
+    return codes.astype(np.uint64) + np.uint64(1)
+
+
+def _powers(base, n, modulus):
+    """base**k % modulus for k in range(n), as uint64 array."""
+    m = int(n ** 0.5) + 1
+    small = [1]
+    for _ in range(m - 1):
+        small.append(small[-1] * base % modulus)
+    step = small[-1] * base % modulus
+    big = [1]
+    for _ in range(-(-n // m) - 1):
+        big.append(big[-1] * step % modulus)
+    return (np.array(big, dtype=np.uint64)[:, None] *
+            np.array(small, dtype=np.uint64)[None, :] %
+            np.uint64(modulus)).ravel()[:n]
+
+
+def _hashtables(s):
+    """For each modulus, the powers of the base and the prefix sums of
+    codes times inverse powers of the base, from which substring hashes are
+    computed, see _substringhashes."""
+    codes = _charcodes(s)
+    tables = []
+    for base, modulus in zip(_hashbases, _hashmoduli):
+        m = np.uint64(modulus)
+        powers = _powers(base, max(len(codes), 1), modulus)
+        inversepowers = _powers(pow(base, modulus - 2, modulus),
+                                max(len(codes), 1), modulus)
+        prefixsums = np.zeros(len(codes) + 1, dtype=np.uint64)
+        np.cumsum(codes * inversepowers[:len(codes)] % m,
+                  out=prefixsums[1:])
+        tables.append((powers, prefixsums % m))
+    return tables
+
+
+def _substringhashes(tables, charstarts, charlengths):
+    """Hashes of the substrings with the given character offsets and
+    lengths, as int64 array."""
+    hashes = []
+    for (powers, prefixsums), modulus in zip(tables, _hashmoduli):
+        m = np.uint64(modulus)
+        ends = charstarts + charlengths
+        sums = (prefixsums[ends] + m - prefixsums[charstarts]) % m
+        hashes.append(powers[ends - 1] * sums % m)
+    return ((hashes[0] << np.uint64(31)) | hashes[1]).astype(np.int64)
+
+
+def rollinghash(s):
+    """
+    Returns the rolling hash of a string, which equals the hash of the same
+    substring in a `SubstringView` of any other string.
+
+    Parameters
+    ----------
+    s : str or bytes
+        The string to hash.
+
+    Returns
+    -------
+    int
+
+    Examples
+    --------
+    >>> from agl.strfuncs import lengthnsubstringview, rollinghash
+    >>> view = lengthnsubstringview('abcabc', n=3)
+    >>> (view.hashes() == rollinghash('bca')).tolist()
+    [False, True, False, False]
+
+    """
+    if len(s) == 0:
+        return 0
+    return int(_substringhashes(_hashtables(s), np.array([0]),
+                                np.array([len(s)]))[0])
+
+
+class SubstringView:
+    """
+    A lazy view on substrings of a string, represented by their start
+    positions and lengths in tokens, so that no substring is created
+    unless asked for.
+
+    Views are created by `lengthnsubstringview` and `substringview`. They
+    can be indexed and iterated over, which creates the substrings
+    involved, or materialized as a whole. Substrings can be compared and
+    counted without creating them, by means of their rolling hashes. Equal
+    substrings have equal hashes. Different substrings have different
+    hashes, except for a very small chance of collision (of the order of
+    2**-62 for a pair of substrings).
+
+    Parameters
+    ----------
+    s : str or bytes
+        The string.
+    starts : sequence of ints
+        The start positions of the substrings, in tokens.
+    lengths : sequence of ints
+        The lengths of the substrings, in tokens.
+    readingframe : positive int, default 1
+        The number of characters that make up one string token.
+
+    """
+
+    def __init__(self, s, starts, lengths, readingframe=1):
+        self._string = s
+        self._starts = np.asarray(starts, dtype=np.int64)
+        self._lengths = np.asarray(lengths, dtype=np.int64)
+        self._readingframe = readingframe
+        self._hashtables = None
+
+    def __str__(self):
+        return f'<SubstringView of {len(self)} substrings>'
+
+    __repr__ = __str__
+
+    @property
+    def string(self):
+        """The string of which the view holds substrings"""
+        return self._string
+
+    @property
+    def readingframe(self):
+        return self._readingframe
+
+    @property
+    def starts(self):
+        """Start positions of the substrings, in tokens"""
+        return self._starts
+
+    @property
+    def lengths(self):
+        """Lengths of the substrings, in tokens"""
+        return self._lengths
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            view = SubstringView(self._string, self._starts[index],
+                                 self._lengths[index], self._readingframe)
+            view._hashtables = self._hashtables
+            return view
+        rf = self._readingframe
+        start = int(self._starts[index]) * rf
+        return self._string[start:start + int(self._lengths[index]) * rf]
+
+    def __iter__(self):
+        s = self._string
+        rf = self._readingframe
+        for start, length in zip(self._starts.tolist(),
+                                 self._lengths.tolist()):
+            yield s[start * rf:(start + length) * rf]
+
+    def materialize(self):
+        """Returns a tuple with all substrings."""
+        return tuple(self)
+
+    def hashes(self):
+        """Returns the rolling hashes of the substrings as int64 array. See
+        also `rollinghash`."""
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self._hashtables is None:
+            self._hashtables = _hashtables(self._string)
+        rf = self._readingframe
+        return _substringhashes(self._hashtables, self._starts * rf,
+                                self._lengths * rf)
+
+
+def lengthnsubstringview(s, n, readingframe=1):
+    """
+    Returns a lazy view on the consecutive length-n substrings of s, in the
+    same order as `lengthnsubstrings`, without creating them.
+
+    Parameters
+    ----------
+    s : str or bytes
+        Token string from which length-n substrings are taken.
+    n : positive int
+        Length of the substrings
+    readingframe : positive int, default 1
+        The number of characters that make up one string token.
+
+    Returns
+    -------
+    SubstringView
+
+    Examples
+    --------
+    >>> from agl.strfuncs import lengthnsubstringview
+    >>> view = lengthnsubstringview('a1a2a3c1b3b2b1', n=4, readingframe=2)
+    >>> view.starts
+    array([0, 1, 2, 3])
+    >>> view[1]
+    'a2a3c1b3'
+
+    """
+    nss = max(0, int(len(s) / readingframe) - n + 1)
+    return SubstringView(s, np.arange(nss), np.full(nss, n),
+                         readingframe=readingframe)
+
+
+def substringview(s, minlength=1, maxlength=None, readingframe=1):
+    """
+    Returns a lazy view on all consecutive substrings of s, in the same order
+    as `substrings`, without creating them.
+
+    Parameters
+    ----------
+    s : str or bytes
+        Token string from which substrings are taken.
+    minlength : positive int
+        Minimum length of the substrings
+    maxlength : positive int
+        Maximum length of the substrings
+    readingframe : positive int, default 1
+        The number of characters that make up one string token.
+
+    Returns
+    -------
+    SubstringView
+
+    Examples
+    --------
+    >>> from agl.strfuncs import substringview
+    >>> view = substringview('cdef', minlength=3)
+    >>> view.materialize()
+    ('cde', 'def', 'cdef')
+
+    """
+    ntokens = int(len(s) / readingframe)
+    if maxlength is None:
+        maxlength = ntokens
+    lengths = range(minlength, min(maxlength, ntokens) + 1)
+    starts = [np.arange(ntokens - n + 1) for n in lengths]
+    return SubstringView(
+        s, np.concatenate(starts) if starts else [],
+        np.repeat(np.array(lengths, dtype=np.int64),
+                  [ntokens - n + 1 for n in lengths]),
+        readingframe=readingframe)
 
-    @lru_cache(maxsize=512)
-    def _substrings(s, minlength=1, maxlength=None, readingframe=1):
-        if maxlength is None:
-            maxlength = int(len(s) / readingframe)
-        ss = []
-        for n in range(minlength, maxlength + 1):
-            ss.extend(lengthnsubstrings(s, n=n, readingframe=readingframe))
-        return tuple(ss)
-    return _substrings(s=s, minlength=minlength, maxlength=maxlength,
-                       readingframe=readingframe)
 
 # FIXME functions next need doc
 def lengthnhead(s, n, readingframe=1):
@@ -105,21 +485,109 @@ def lengthnanchors(s, n, readingframe=1):
 
 # FIXME functions next need doc and tests
 def heads(s, minlength=1, maxlength=None, readingframe=1):
+    return tuple(iheads(s, minlength=minlength, maxlength=maxlength,
+                        readingframe=readingframe))
+
+def tails(s, minlength=1, maxlength=None, readingframe=1):
+    return tuple(itails(s, minlength=minlength, maxlength=maxlength,
+                        readingframe=readingframe))
+
+def anchors(s, minlength=1, maxlength=None, readingframe=1):
+    return tuple(ianchors(s, minlength=minlength, maxlength=maxlength,
+                          readingframe=readingframe))
+
+
+# Generator versions of the functions above. They yield the same items in the
+# same order, but one at a time, so that callers that stop early or filter
+# heavily do not build all substrings of long strings. They are not memoized.
+
+def ilengthnsubstrings(s, n, readingframe=1):
+    """
+    Generates the consecutive length-n substrings of s, as
+    `lengthnsubstrings` does, but lazily.
+
+    Parameters
+    ----------
+    s : string
+        Token string from which length-n substrings are generated, or an
+        iterable of them.
+    n : positive int
+        Length of the substrings
+    readingframe : positive int, default 1
+        The number of characters that make up one string token.
+
+    Yields
+    ------
+    substrings
+
+    Examples
+    --------
+    >>> from agl.strfuncs import ilengthnsubstrings
+    >>> next(ilengthnsubstrings('a1a2a3c1b3b2b1', n=4, readingframe=2))
+    'a1a2a3c1'
+
+    """
+    # how many length-n substrings exist in in s?
+    nss = int(len(s) / readingframe) - n + 1
+    nglyphs = n * readingframe
+    for i in range(0, nss * readingframe, readingframe):
+        yield s[i:i + nglyphs]
+
+
+def isubstrings(s, minlength=1, maxlength=None, readingframe=1):
+    """
+    Generates all consecutive substrings of s, as `substrings` does, but
+    lazily, shortest first.
+
+    Parameters
+    ----------
+    s : string
+        Token string from which substrings are generated, or an iterable of
+        them.
+    minlength : positive int
+        Minimum length of the substrings
+    maxlength : positive int
+        Maximum length of the substrings
+    readingframe : positive int, default 1
+        The number of characters that make up one string token.
+
+    Yields
+    ------
+    substrings
+
+    Examples
+    --------
+    >>> from agl.strfuncs import isubstrings
+    >>> from itertools import islice
+    >>> list(islice(isubstrings('cdef', minlength=2), 4))
+    ['cd', 'de', 'ef', 'cde']
+
+    """
     if maxlength is None:
         maxlength = int(len(s) / readingframe)
-    return tuple(lengthnhead(s, n=n, readingframe=readingframe)
-                     for n in range(minlength, maxlength + 1))
+    for n in range(minlength, maxlength + 1):
+        yield from ilengthnsubstrings(s, n=n, readingframe=readingframe)
 
-def tails(s, minlength=1, maxlength=None, readingframe=1):
+
+def iheads(s, minlength=1, maxlength=None, readingframe=1):
+    """Generates the heads of s, shortest first, as `heads` does."""
     if maxlength is None:
         maxlength = int(len(s) / readingframe)
-    return tuple(lengthntail(s, n=n, readingframe=readingframe)
-                     for n in range(minlength, maxlength + 1))
+    for n in range(minlength, maxlength + 1):
+        yield lengthnhead(s, n=n, readingframe=readingframe)
 
-def anchors(s, minlength=1, maxlength=None, readingframe=1):
+
+def itails(s, minlength=1, maxlength=None, readingframe=1):
+    """Generates the tails of s, shortest first, as `tails` does."""
     if maxlength is None:
         maxlength = int(len(s) / readingframe)
-    return tuple(lengthnhead(s, n=n, readingframe=readingframe)
-                                for n in range(minlength, maxlength + 1)) + \
-           tuple(lengthntail(s, n=n, readingframe=readingframe)
-                                for n in range(minlength, maxlength + 1))
+    for n in range(minlength, maxlength + 1):
+        yield lengthntail(s, n=n, readingframe=readingframe)
+
+
+def ianchors(s, minlength=1, maxlength=None, readingframe=1):
+    """Generates the heads and then the tails of s, as `anchors` does."""
+    yield from iheads(s, minlength=minlength, maxlength=maxlength,
+                      readingframe=readingframe)
+    yield from itails(s, minlength=minlength, maxlength=maxlength,
+                      readingframe=readingframe)
@@ -1,8 +1,10 @@
 from unittest import TestLoader, TextTestRunner, TestSuite
 
-from . import test_PARSER, test_strfuncs
+from . import test_PARSER, test_parsermatrix, test_parsersweep, \
+    test_strcomp, test_strfuncs
 
-modules = [test_PARSER, test_strfuncs]
+modules = [test_PARSER, test_parsermatrix, test_parsersweep, test_strcomp,
+           test_strfuncs]
 
 def test(verbosity=1):
     suite =TestSuite()
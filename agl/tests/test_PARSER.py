@@ -1,3 +1,7 @@
+import itertools
+import os
+import random
+import tempfile
 import unittest
 from agl import PARSER
 
@@ -65,3 +69,305 @@ class TestModel(unittest.TestCase):
                             set(scores.keys()))
         for unit, weight in model.perceptshaper.items():
             self.assertAlmostEqual(weight, scores[unit], delta = 0.001)
+
+    def test_memoryunitindex(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        model.run(seq, perceptsizes=perceptsizes)
+        memoryunits = {unit for unit, weight in model.perceptshaper.items()
+                       if weight > model.shapingthreshold}
+        self.assertSetEqual(model._memoryunits, memoryunits)
+        self.assertEqual(max(model._memoryunitlengths),
+                         max(map(len, memoryunits)))
+
+    def test_forgetting(self):
+        model = PARSER.PARSER(primitives=['a', 'b', 'c'],
+                              perceptshaper={'ab': 2.0, 'bc': 0.1})
+        model.run('cc', perceptsizes=[1, 1])
+        self.assertNotIn('bc', model.perceptshaper)
+        self.assertAlmostEqual(model.perceptshaper['ab'], 1.9)
+        self.assertAlmostEqual(model.perceptshaper['c'], 1.45)
+
+    def test_positiveforgetting(self):
+        # units that rise above the shaping threshold by forgetting become
+        # memory units
+        model = PARSER.PARSER(primitives=['a', 'b', 'c'],
+                              perceptshaper={'ab': 0.95}, forgetweight=0.1)
+        model.run('cc', perceptsizes=[1, 1])
+        self.assertSetEqual(model._memoryunits, {'ab', 'c'})
+        self.assertAlmostEqual(model.perceptshaper['ab'], 1.15)
+
+    def test_encodetokens(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        model.run(seq, perceptsizes=perceptsizes)
+        emodel = PARSER.PARSER(primitives=primitives, readingframe=2,
+                               encodetokens=True)
+        emodel.run(seq, perceptsizes=perceptsizes)
+        self.assertDictEqual(emodel.perceptshaper, model.perceptshaper)
+
+    def test_encodetokens_widening(self):
+        # more tokens in the input than fit in the initial token codes
+        tokens = [''.join(t) for t in
+                  itertools.product('abcdefghijklmnopqrstuvwxyz', repeat=2)]
+        primitives = tokens[:100]
+        rng = random.Random(1)
+        inputseq = ''.join(rng.choice(tokens[:300]) for _ in range(2000))
+        chunks = [inputseq[i:i + 7] for i in range(0, len(inputseq), 7)]
+        model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                              randomseed=3)
+        model.run(inputseq)
+        recorder = PARSER.WeightRecorder()
+        emodel = PARSER.PARSER(primitives=primitives, readingframe=2,
+                               randomseed=3, encodetokens=True,
+                               recorder=recorder)
+        emodel.run(inputseq)
+        self.assertDictEqual(emodel.perceptshaper, model.perceptshaper)
+        self.assertEqual(len(set(recorder.units)), len(recorder.units))
+        smodel = PARSER.PARSER(primitives=primitives, readingframe=2,
+                               randomseed=3, encodetokens=True)
+        percepts = list(smodel.run_stream(chunks))
+        self.assertEqual(''.join(percepts), inputseq)
+        self.assertDictEqual(smodel.perceptshaper, model.perceptshaper)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'state')
+            emodel.save_state(filename)
+            lmodel = PARSER.PARSER.load_state(filename)
+        self.assertDictEqual(lmodel.perceptshaper, emodel.perceptshaper)
+
+    def test_remainder(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        self.assertEqual(model.run(seq, perceptsizes=perceptsizes), '')
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        remainder = model.run(seq, perceptsizes=[3, 3])
+        self.assertEqual(remainder, seq[12:])
+
+    def test_run_stream(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        chunks = [seq[i:i + 7] for i in range(0, len(seq), 7)]
+        for encodetokens in (False, True):
+            model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                  encodetokens=encodetokens)
+            model.run(seq, perceptsizes=perceptsizes)
+            smodel = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                   encodetokens=encodetokens)
+            percepts = list(smodel.run_stream(chunks,
+                                              perceptsizes=perceptsizes))
+            self.assertEqual(''.join(percepts), seq)
+            self.assertDictEqual(smodel.perceptshaper, model.perceptshaper)
+
+    def test_inspection(self):
+        # reading the percept shaper during a run does not change results
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        for forgetweight in (-0.05, -0.1):
+            for seed in range(3):
+                model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                      randomseed=seed,
+                                      forgetweight=forgetweight)
+                model.run(seq)
+                smodel = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                       randomseed=seed,
+                                       forgetweight=forgetweight)
+                for _ in smodel.run_stream([seq]):
+                    smodel.perceptshaper
+                self.assertDictEqual(smodel.perceptshaper,
+                                     model.perceptshaper)
+
+    def test_perceptshaper_edits(self):
+        # edits to the last snapshot are taken over, also with encoded tokens
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        results = []
+        for encodetokens in (False, True):
+            model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                  randomseed=3, encodetokens=encodetokens)
+            model.run(seq[:200])
+            ps = model.perceptshaper
+            changed, removed = sorted(ps)[:2]
+            ps[changed] = 5.0
+            del ps[removed]
+            ps['zzqq'] = 2.0
+            self.assertEqual(model.weight(changed), 5.0)
+            self.assertEqual(model.weight('zzqq'), 2.0)
+            self.assertRaises(KeyError, model.weight, removed)
+            self.assertRaises(KeyError, model.weight, 'zzzz')
+            # edits to an older snapshot are ignored
+            old = model.perceptshaper
+            model.perceptshaper
+            old[changed] = 6.0
+            self.assertEqual(model.weight(changed), 5.0)
+            # snapshots do not follow later runs
+            model.run(seq[200:])
+            self.assertNotEqual(ps, model.perceptshaper)
+            for unit, weight in model.perceptshaper.items():
+                self.assertEqual(model.weight(unit), weight)
+            results.append(model.perceptshaper)
+        self.assertDictEqual(results[0], results[1])
+
+    def test_run_batch(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        params = [{}, {'forgetweight': -0.1, 'maxperceptsize': 4}]
+        result = PARSER.PARSER.run_batch(seq, primitives, seeds=[3, 4],
+                                         params=params, readingframe=2)
+        self.assertEqual(result.weights.shape, (2, len(result.units)))
+        for subject, (seed, p) in enumerate(zip([3, 4], params)):
+            model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                  randomseed=seed, **p)
+            model.run(seq)
+            self.assertDictEqual(result.get_perceptshaper(subject),
+                                 model.perceptshaper)
+        df = result.get_pandasdataframe()
+        self.assertListEqual(list(df['seed']), [3, 4])
+        self.assertListEqual(list(df['forgetweight']), [-0.05, -0.1])
+        self.assertRaises(ValueError, PARSER.PARSER.run_batch, seq,
+                          primitives, seeds=[3],
+                          params={'maxunits': 3, 'pruningpolicy': 'random'},
+                          readingframe=2)
+
+    def test_recorder(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        recorder = PARSER.WeightRecorder()
+        model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                              recorder=recorder)
+        model.run(seq, perceptsizes=perceptsizes)
+        nsteps = len(perceptsizes)
+        for unit, weight in model.perceptshaper.items():
+            steps, weights = recorder.get_trajectory(unit, laststep=nsteps)
+            self.assertEqual(steps[-1], nsteps)
+            self.assertAlmostEqual(weights[-1], weight)
+        df = recorder.get_pandasdataframe()
+        self.assertEqual(len(df), len(recorder))
+        removed = set(df[df['event'] == 'removal']['unit'])
+        self.assertIn('pipabi', removed)
+
+    def test_tracer(self):
+        events = []
+        def tracer(model, event, **info):
+            events.append(event)
+        model = PARSER.PARSER(primitives=['a', 'b'], tracer=tracer)
+        model.run('abab', perceptsizes=[2, 2])
+        self.assertEqual(events.count('startstep'), 2)
+        self.assertEqual(events[-1], 'endstep')
+        self.assertIsNone(PARSER.PARSER(primitives=['a'])._tracer)
+
+    def test_save_load_state(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        for encodetokens in (False, True):
+            model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                  randomseed=5, encodetokens=encodetokens)
+            model.run(seq)
+            with tempfile.TemporaryDirectory() as dirname:
+                filename = os.path.join(dirname, 'state.npz')
+                model.save_state(filename)
+                model.run(seq)
+                resumed = PARSER.PARSER.load_state(filename)
+            self.assertEqual(resumed.randomseed, 5)
+            resumed.run(seq)
+            self.assertDictEqual(resumed.perceptshaper, model.perceptshaper)
+        # changes made through the perceptshaper property are saved
+        model = PARSER.PARSER(primitives=['a', 'b'], randomseed=5)
+        model.run('abab')
+        model.perceptshaper['zzz'] = 2.0
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'state.npz')
+            model.save_state(filename)
+            resumed = PARSER.PARSER.load_state(filename)
+            # the extension is added on loading as well as on saving
+            filename = os.path.join(dirname, 'state')
+            model.save_state(filename)
+            PARSER.PARSER.load_state(filename)
+        self.assertDictEqual(resumed.perceptshaper, model.perceptshaper)
+        self.assertEqual(resumed.perceptshaper['zzz'], 2.0)
+
+    def test_randomseed(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        models = [PARSER.PARSER(primitives=primitives, readingframe=2,
+                                randomseed=seed) for seed in (5, 5, 6)]
+        sizes = [[len(model._perceivedunits)
+                  for _ in model.run_stream([seq])] for model in models]
+        self.assertListEqual(sizes[0], sizes[1])
+        self.assertNotEqual(sizes[0], sizes[2])
+        self.assertSetEqual(set(sizes[0]), {1, 2, 3})
+        self.assertDictEqual(models[0].perceptshaper, models[1].perceptshaper)
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        self.assertIsInstance(model.randomseed, int)
+
+    def test_maxunits(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        for pruningpolicy in ('lowestweight', 'leastrecent'):
+            model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                                  randomseed=5, maxunits=15,
+                                  pruningpolicy=pruningpolicy)
+            for percept in model.run_stream([seq]):
+                self.assertLessEqual(len(model.perceptshaper), 15)
+            stats = model.pruningstats
+            self.assertGreater(stats['npruned'], 0)
+            self.assertGreaterEqual(stats['npruned'], stats['nprunesteps'])
+            self.assertLessEqual(stats['maxprunedweight'],
+                                 stats['prunedweight'])
+        self.assertRaises(ValueError, PARSER.PARSER, primitives=primitives,
+                          readingframe=2, maxunits=15,
+                          pruningpolicy='random')
+        for maxunits in (-1, 0, 2.5):
+            self.assertRaises(ValueError, PARSER.PARSER,
+                              primitives=primitives, readingframe=2,
+                              maxunits=maxunits)
+
+    def test_stats(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        self.assertIsNone(model.stats)
+        model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                              profile=True)
+        model.run(seq, perceptsizes=perceptsizes)
+        stats = model.stats
+        self.assertEqual(stats['nsteps'], len(perceptsizes))
+        self.assertEqual(stats['nunitscreated'] - stats['nunitsremoved'],
+                         len(model.perceptshaper))
+        self.assertGreaterEqual(stats['nscanned'], len(seq) // 2)
+        self.assertGreater(stats['ninterferencepairs'], 0)
+        self.assertGreater(stats['updatetime'], 0.)
+        model.reset_stats()
+        self.assertEqual(sum(model.stats.values()), 0)
+
+    def test_fork(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        model = PARSER.PARSER(primitives=primitives, readingframe=2,
+                              randomseed=5)
+        model.run(seq)
+        trained = dict(model.perceptshaper)
+        fork1 = model.fork()
+        fork2 = model.fork(randomseed=6)
+        self.assertIs(fork1._perceptshaper, model._perceptshaper)
+        fork1.run(seq)
+        self.assertDictEqual(model.perceptshaper, trained)
+        fork2.run(seq)
+        self.assertDictEqual(model.perceptshaper, trained)
+        model.run(seq)
+        self.assertDictEqual(fork1.perceptshaper, model.perceptshaper)
+        self.assertNotEqual(fork2.perceptshaper, model.perceptshaper)
+
+    def test_score_items(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        model = PARSER.PARSER(primitives=primitives, readingframe=2)
+        model.run(seq, perceptsizes=perceptsizes)
+        ps = dict(model.perceptshaper)
+        segmentations, sumweights, maxweights = \
+            model.score_items(['pabiku', 'golatu', 'bikuda', ''])
+        self.assertListEqual(segmentations, [['pabiku'], ['golatu'],
+                                             ['bi', 'ku', 'da'], []])
+        self.assertAlmostEqual(sumweights[1], ps['golatu'])
+        self.assertAlmostEqual(sumweights[2], ps['ku'])
+        self.assertAlmostEqual(maxweights[2], ps['ku'])
+        self.assertEqual(sumweights[3], 0.)
+        self.assertDictEqual(model.perceptshaper, ps)
+        # scoring does not give codes to unknown tokens
+        emodel = PARSER.PARSER(primitives=primitives, readingframe=2,
+                               encodetokens=True)
+        emodel.run(seq, perceptsizes=perceptsizes)
+        tokens = list(emodel._tokens)
+        items = ['xyz1', 'pabixxku', 'xx', 'golatu']
+        for result, eresult in zip(model.score_items(items),
+                                   emodel.score_items(items)):
+            self.assertListEqual(list(eresult), list(result))
+        self.assertListEqual(emodel._tokens, tokens)
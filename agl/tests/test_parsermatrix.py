@@ -0,0 +1,66 @@
+import random
+import unittest
+from agl.PARSER import PARSER
+from agl.parsermatrix import MatrixPARSER
+from agl.tests.test_PARSER import seq, perceptsizes
+
+
+class TestMatrixPARSER(unittest.TestCase):
+
+    def test_sameresults(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        for kwargs in [{},
+                       {'encodetokens': True},
+                       {'forgetweight': 0.01},
+                       {'maxunits': 12},
+                       {'maxunits': 12, 'pruningpolicy': 'leastrecent'}]:
+            model = PARSER(primitives, readingframe=2, randomseed=3,
+                           profile=True, **kwargs)
+            mmodel = MatrixPARSER(primitives, readingframe=2, randomseed=3,
+                                  profile=True, **kwargs)
+            model.run(seq)
+            mmodel.run(seq)
+            self.assertDictEqual(mmodel.perceptshaper, model.perceptshaper)
+            self.assertSetEqual(mmodel._memoryunits, model._memoryunits)
+            self.assertDictEqual(mmodel.pruningstats, model.pruningstats)
+            self.assertEqual(mmodel.stats['ninterferencepairs'],
+                             model.stats['ninterferencepairs'])
+
+    def test_largevocabulary(self):
+        # many primitives that each occur in few units, and units that are
+        # removed again by forgetting
+        rng = random.Random(0)
+        primitives = [f'{i:04d}' for i in range(1000)]
+        words = [''.join(rng.sample(primitives, 3)) for _ in range(300)]
+        inputseq = ''.join(rng.choice(words) for _ in range(1000))
+        model = PARSER(primitives, readingframe=4, forgetweight=-0.002,
+                       randomseed=3)
+        mmodel = MatrixPARSER(primitives, readingframe=4,
+                              forgetweight=-0.002, randomseed=3)
+        model.run(inputseq)
+        mmodel.run(inputseq)
+        self.assertDictEqual(mmodel.perceptshaper, model.perceptshaper)
+        self.assertSetEqual(mmodel._memoryunits, model._memoryunits)
+        # only primitives of units in the percept shaper have a column
+        self.assertSetEqual(
+            set(mmodel._primitivecolumns),
+            {p for counts in mmodel._unitcounts.values() for p in counts})
+
+    def test_fork(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        mmodel = MatrixPARSER(primitives, readingframe=2)
+        mmodel.run(seq, perceptsizes=perceptsizes)
+        trained = dict(mmodel.perceptshaper)
+        fork = mmodel.fork(randomseed=4)
+        fork.run(seq)
+        self.assertDictEqual(mmodel.perceptshaper, trained)
+        model = PARSER(primitives, readingframe=2)
+        model.run(seq, perceptsizes=perceptsizes)
+        self.assertDictEqual(model.perceptshaper, trained)
+        model = model.fork(randomseed=4)
+        model.run(seq)
+        self.assertDictEqual(fork.perceptshaper, model.perceptshaper)
+
+
+if __name__ == '__main__':
+    unittest.main()
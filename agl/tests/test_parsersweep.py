@@ -0,0 +1,28 @@
+import unittest
+from agl.PARSER import PARSER
+from agl.parsersweep import parametergrid, sweep
+from agl.tests.test_PARSER import seq
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_parametergrid(self):
+        grid = parametergrid(forgetweight=[-0.05, -0.1],
+                             maxperceptsize=[2, 3])
+        self.assertEqual(len(grid), 4)
+        self.assertDictEqual(grid[1], {'forgetweight': -0.05,
+                                       'maxperceptsize': 3})
+
+    def test_sweep(self):
+        primitives = set([seq[i:i + 2] for i in range(len(seq) - 1)])
+        paramsets = parametergrid(forgetweight=[-0.05, -0.1])
+        df = sweep(seq, primitives, paramsets, seeds=[1, 2], nprocesses=2,
+                   readingframe=2)
+        self.assertEqual(len(df), 4)
+        self.assertListEqual(list(df['seed']), [1, 2, 1, 2])
+        model = PARSER(primitives, randomseed=2, forgetweight=-0.1,
+                       readingframe=2)
+        model.run(seq)
+        row = df.iloc[3]
+        for unit, weight in model.perceptshaper.items():
+            self.assertEqual(row[unit], weight)
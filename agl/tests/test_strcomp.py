@@ -0,0 +1,136 @@
+import random
+import unittest
+from agl.strcomp import sharedlengthnsubstrings, longestsharedsubstrings, \
+    longestsharedsubstringlength
+
+
+def bruteforcesharedlengthnsubstrings(s1, s2, n, readingframe=1):
+    # compares each length-n substring of s1 with s2 at every token offset
+    rf = readingframe
+    matches = []
+    for pos in range(len(s1) // rf - n + 1):
+        substring = s1[pos * rf:(pos + n) * rf]
+        positions = tuple((pos, i // rf) for i in range(0, len(s2), rf)
+                          if s2[i:i + n * rf] == substring)
+        if positions:
+            matches.append((substring, positions))
+    return tuple(matches)
+
+
+def bruteforcelongestsharedsubstrings(s1, s2, readingframe=1):
+    # tries all lengths, from the longest possible down
+    for n in range(len(s1) // readingframe, 0, -1):
+        matches = bruteforcesharedlengthnsubstrings(s1, s2, n, readingframe)
+        if matches:
+            return matches
+    return ()
+
+
+# per reading frame, tokens that also match each other across token
+# boundaries
+tokensets = {1: ['a', 'b', 'c'], 2: ['a1', '1a', 'b2'], 3: ['a1a', '1a1', 'bbb']}
+
+
+def randomstrings(seed, ncases=500):
+    # pairs of token strings with few different tokens, so that there are
+    # many repeated substrings, and a reading frame
+    rng = random.Random(seed)
+    for _ in range(ncases):
+        readingframe = rng.choice([1, 2, 3])
+        tokens = tokensets[readingframe][:rng.randint(1, 3)]
+        s1, s2 = (''.join(rng.choice(tokens)
+                          for _ in range(rng.randint(1, 12)))
+                  for _ in range(2))
+        yield s1, s2, readingframe
+
+
+class TestSharedLengthNSubstrings(unittest.TestCase):
+
+    def test_default(self):
+        self.assertTupleEqual(
+            sharedlengthnsubstrings('abcdefg', 'cdfgbcd', n=2),
+            (('bc', ((1, 4),)), ('cd', ((2, 0), (2, 5))),
+             ('fg', ((5, 2),))))
+        self.assertTupleEqual(sharedlengthnsubstrings('abc', 'def', n=1), ())
+
+    def test_readingframe(self):
+        self.assertTupleEqual(
+            sharedlengthnsubstrings('a1a2c1b2b1', 'c1b2b1a1a2', n=2,
+                                    readingframe=2),
+            (('a1a2', ((0, 3),)), ('c1b2', ((2, 0),)), ('b2b1', ((3, 1),))))
+        # matches only at token boundaries
+        self.assertTupleEqual(
+            sharedlengthnsubstrings('a1a1', 'xa1a1x', n=2, readingframe=2),
+            ())
+
+    def test_multipleoccurrences(self):
+        # hits in order of s1, repeated substrings of s1 each get a hit,
+        # and positions in s2 are in increasing order
+        self.assertTupleEqual(
+            sharedlengthnsubstrings('a1b2a1', 'b2a1a1b2a1', n=1,
+                                    readingframe=2),
+            (('a1', ((0, 1), (0, 2), (0, 4))), ('b2', ((1, 0), (1, 3))),
+             ('a1', ((2, 1), (2, 2), (2, 4)))))
+
+    def test_bruteforce(self):
+        for s1, s2, readingframe in randomstrings(seed=0):
+            for n in range(1, 5):
+                self.assertTupleEqual(
+                    sharedlengthnsubstrings(s1, s2, n, readingframe),
+                    bruteforcesharedlengthnsubstrings(s1, s2, n,
+                                                      readingframe))
+
+
+class TestLongestSharedSubstrings(unittest.TestCase):
+
+    def test_default(self):
+        self.assertTupleEqual(longestsharedsubstrings('acd', 'cdacdeacd'),
+                              (('acd', ((0, 2), (0, 6))),))
+        self.assertTupleEqual(longestsharedsubstrings('acde', 'cdbcdeacd'),
+                              (('acd', ((0, 6),)), ('cde', ((1, 3),))))
+        self.assertEqual(longestsharedsubstringlength('acde', 'cdbcdeacd'), 3)
+        self.assertTupleEqual(longestsharedsubstrings('abc', 'def'), ())
+        self.assertEqual(longestsharedsubstringlength('abc', 'def'), 0)
+
+    def test_readingframe(self):
+        self.assertTupleEqual(
+            longestsharedsubstrings('a1a2', 'a2a3a1a2a1', readingframe=2),
+            (('a1a2', ((0, 2),)),))
+        self.assertEqual(
+            longestsharedsubstringlength('a1a2', 'a2a3a1a2a1',
+                                         readingframe=2), 2)
+        # '1a1' occurs in s2, but not at a token boundary
+        self.assertEqual(
+            longestsharedsubstringlength('1a1a', 'a1a1', readingframe=2), 0)
+
+    def test_shortstrings(self):
+        self.assertTupleEqual(longestsharedsubstrings('', 'abc'), ())
+        self.assertEqual(longestsharedsubstringlength('', 'abc'), 0)
+        self.assertTupleEqual(longestsharedsubstrings('a', 'a'),
+                              (('a', ((0, 0),)),))
+        self.assertEqual(longestsharedsubstringlength('b1', 'a1',
+                                                      readingframe=2), 0)
+
+    def test_repeatedtokens(self):
+        self.assertTupleEqual(longestsharedsubstrings('aaaa', 'aaa'),
+                              (('aaa', ((0, 0),)), ('aaa', ((1, 0),))))
+        self.assertEqual(longestsharedsubstringlength('aaaa', 'aaa'), 3)
+        self.assertEqual(
+            longestsharedsubstringlength('a1a1a1', 'a1a1b2a1a1a1',
+                                         readingframe=2), 3)
+
+    def test_invalidstrings(self):
+        self.assertRaises(ValueError, longestsharedsubstrings, 'abc', 'ab',
+                          readingframe=2)
+        self.assertRaises(ValueError, longestsharedsubstringlength, 'ab',
+                          'abc', readingframe=2)
+        self.assertRaises(TypeError, longestsharedsubstrings, 'ab', '')
+
+    def test_bruteforce(self):
+        for s1, s2, readingframe in randomstrings(seed=1):
+            matches = bruteforcelongestsharedsubstrings(s1, s2, readingframe)
+            self.assertTupleEqual(
+                longestsharedsubstrings(s1, s2, readingframe), matches)
+            length = len(matches[0][0]) // readingframe if matches else 0
+            self.assertEqual(
+                longestsharedsubstringlength(s1, s2, readingframe), length)
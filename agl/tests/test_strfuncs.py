@@ -1,6 +1,9 @@
 import unittest
 from agl.strfuncs import lengthnanchors, lengthnhead, lengthntail, \
-    lengthnsubstrings
+    lengthnsubstrings, substrings, cacheinfo, clearcache, setcachesize, \
+    lengthnsubstringview, substringview, rollinghash, heads, tails, \
+    anchors, ilengthnsubstrings, isubstrings, iheads, itails, ianchors
+from agl import strfuncs
 
 
 class TestLengthNSubstrings(unittest.TestCase):
@@ -22,6 +25,10 @@ class TestLengthNSubstrings(unittest.TestCase):
                                                 readingframe=2),
                               ('abcd', 'cdef', 'efgh'))
 
+    def test_unhashable(self):
+        self.assertTupleEqual(lengthnsubstrings(['a', 'b', 'c'], n=2),
+                              (['a', 'b'], ['b', 'c']))
+
 
 class TestLengthNHead(unittest.TestCase):
 
@@ -68,8 +75,93 @@ class TestLengthNAnchors(unittest.TestCase):
                               ('abcd', 'cdef'))
 
 
-
-
-
-
-
+class TestGenerators(unittest.TestCase):
+
+    def test_sameitems(self):
+        for s, rf in (('abcd', 1), ('abcdefgh', 2), (['a', 'b', 'c'], 1)):
+            for n in range(1, 5):
+                self.assertTupleEqual(
+                    tuple(ilengthnsubstrings(s, n=n, readingframe=rf)),
+                    lengthnsubstrings(s, n=n, readingframe=rf))
+            for func, ifunc in ((substrings, isubstrings), (heads, iheads),
+                                (tails, itails), (anchors, ianchors)):
+                self.assertTupleEqual(
+                    tuple(ifunc(s, minlength=2, readingframe=rf)),
+                    func(s, minlength=2, readingframe=rf))
+
+    def test_lazy(self):
+        ss = isubstrings('abcd')
+        self.assertEqual(next(ss), 'a')
+        self.assertEqual(next(ss), 'b')
+
+
+class TestSubstringView(unittest.TestCase):
+
+    def test_materialize(self):
+        for s, rf in (('abcd', 1), ('abcdefgh', 2), (b'a1b2c3b2a1', 2)):
+            for n in range(1, 6):
+                view = lengthnsubstringview(s, n=n, readingframe=rf)
+                self.assertTupleEqual(view.materialize(),
+                                      lengthnsubstrings(s, n=n,
+                                                        readingframe=rf))
+            view = substringview(s, minlength=2, readingframe=rf)
+            self.assertTupleEqual(view.materialize(),
+                                  substrings(s, minlength=2,
+                                             readingframe=rf))
+
+    def test_indexing(self):
+        view = substringview('abcd', maxlength=2)
+        self.assertEqual(len(view), 7)
+        self.assertEqual(view[4], 'ab')
+        self.assertTupleEqual(view[3:5].materialize(), ('d', 'ab'))
+        self.assertListEqual(list(view[-2:]), ['bc', 'cd'])
+
+    def test_hashes(self):
+        s = 'a1b2c3a1b2c3b2a1'
+        view = substringview(s, readingframe=2)
+        hashes = view.hashes().tolist()
+        substrings_ = view.materialize()
+        for ss, h in zip(substrings_, hashes):
+            self.assertEqual(h, rollinghash(ss))
+        self.assertEqual(len(set(hashes)), len(set(substrings_)))
+        self.assertListEqual(view[5:9].hashes().tolist(), hashes[5:9])
+        self.assertRaises(TypeError, rollinghash, ['a', 'b'])
+
+
+class TestCache(unittest.TestCase):
+
+    def tearDown(self):
+        setcachesize()
+
+    def test_hits(self):
+        clearcache()
+        for i in range(3):
+            lengthnsubstrings('abcd', n=2)
+            substrings('abcd', maxlength=2)
+        info = cacheinfo()
+        self.assertEqual(info['lengthnsubstrings'].misses, 1)
+        self.assertEqual(info['lengthnsubstrings'].hits, 2)
+        self.assertEqual(info['substrings'].hits, 2)
+        clearcache()
+        self.assertEqual(cacheinfo()['substrings'].currsize, 0)
+
+    def test_cachesize(self):
+        setcachesize(4)
+        for s in ('ab', 'bc', 'cd'):
+            lengthnsubstrings(s, n=1)
+        info = cacheinfo()['lengthnsubstrings']
+        self.assertEqual(info.maxsize, 4)
+        self.assertEqual(info.currsize, 4)
+        # results larger than the cache are not cached
+        self.assertTupleEqual(lengthnsubstrings('abcd', n=2),
+                              ('ab', 'bc', 'cd'))
+        self.assertEqual(cacheinfo()['lengthnsubstrings'].currsize, 4)
+        # the strings that results are computed from count as well
+        setcachesize(10)
+        lengthnsubstrings('abcd', n=5)
+        self.assertEqual(cacheinfo()['lengthnsubstrings'].currsize, 4)
+        setcachesize(0)
+        self.assertTupleEqual(lengthnsubstrings('abc', n=2), ('ab', 'bc'))
+        self.assertTupleEqual(lengthnsubstrings('abc', n=5), ())
+        self.assertEqual(cacheinfo()['lengthnsubstrings'].currsize, 0)
+        self.assertEqual(len(strfuncs._cachedlengthnsubstrings._results), 0)
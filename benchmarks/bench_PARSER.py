@@ -0,0 +1,196 @@
+"""Benchmarks of `agl.PARSER.PARSER.run`.
+
+Runs the model on synthetic artificial grammar streams of growing length,
+alphabet size and reading frame, and reports for each case the number of
+steps per second, the peak memory allocated during the run, and how the run
+time is split across the phases of the steps (see `PARSER.stats`).
+
+The dictionary based `PARSER` model is benchmarked, or the vectorized
+`MatrixPARSER` model with the `--model` option.
+
+Results can be stored as a baseline and later runs compared with it, so that
+regressions in the hot loop of the model become visible. Baselines are
+machine-dependent; store one on the machine on which you compare.
+
+Usage::
+
+    $ python benchmarks/bench_PARSER.py             # report
+    $ python benchmarks/bench_PARSER.py --save      # store baseline
+    $ python benchmarks/bench_PARSER.py --compare   # compare with baseline
+
+The exit status is 1 if a case regressed, and 2 if there is no baseline to
+compare with.
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from agl.PARSER import PARSER
+from agl.parsermatrix import MatrixPARSER
+
+models = {'PARSER': PARSER, 'MatrixPARSER': MatrixPARSER}
+
+baselinefile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'baselines.json')
+
+# the timers in PARSER.stats over which run time is split; pruning is not
+# benchmarked
+phases = ('perceivetime', 'strengthentime', 'interferetime', 'updatetime',
+          'forgettime')
+
+
+def makestream(ntokens, alphabetsize, readingframe, wordlength=3,
+               nwords=None, seed=0):
+    """Returns a synthetic artificial grammar stream and its primitives.
+
+    The primitives are `alphabetsize` distinct tokens of `readingframe`
+    characters. They are combined into `nwords` words of `wordlength`
+    tokens, and the stream is a random concatenation of those words, without
+    immediate repetitions, of (about) `ntokens` tokens.
+
+    """
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    primitives = [''.join(p) for p in itertools.islice(
+        itertools.product(letters, repeat=readingframe), alphabetsize)]
+    if len(primitives) < alphabetsize:
+        raise ValueError(f"cannot make {alphabetsize} primitives with a "
+                         f"readingframe of {readingframe}")
+    if nwords is None:
+        nwords = max(2, alphabetsize // wordlength)
+    words = [''.join(rng.sample(primitives, wordlength))
+             for _ in range(nwords)]
+    stream = []
+    previous = None
+    for _ in range(max(1, ntokens // wordlength)):
+        word = rng.choice([w for w in words if w != previous])
+        stream.append(word)
+        previous = word
+    return ''.join(stream), primitives
+
+
+# (name, ntokens, alphabetsize, readingframe); three scaling curves
+cases = [(f'length{n}', n, 12, 2) for n in (2000, 8000, 32000)] + \
+        [(f'alphabet{a}', 8000, a, 2) for a in (24, 48)] + \
+        [(f'readingframe{rf}', 8000, 12, rf) for rf in (1, 3)]
+
+
+def runcase(ntokens, alphabetsize, readingframe, repeats=3, seed=0,
+            model=PARSER):
+    """Benchmarks one case. Returns a dictionary with results."""
+    modelclass = model
+    stream, primitives = makestream(ntokens, alphabetsize, readingframe,
+                                    seed=seed)
+    def newmodel(profile=False):
+        return modelclass(primitives, readingframe=readingframe,
+                          randomseed=seed, profile=profile)
+    # speed, best of a number of repeats, without instrumentation
+    besttime = float('inf')
+    for _ in range(repeats):
+        model = newmodel()
+        t0 = time.perf_counter()
+        model.run(stream)
+        besttime = min(besttime, time.perf_counter() - t0)
+    nsteps = model._stepno
+    # split of run time across phases
+    model = newmodel(profile=True)
+    t0 = time.perf_counter()
+    model.run(stream)
+    totaltime = time.perf_counter() - t0
+    stats = model.stats
+    # peak memory
+    model = newmodel()
+    tracemalloc.start()
+    model.run(stream)
+    _, peakmemory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ntokens': ntokens,
+            'alphabetsize': alphabetsize,
+            'readingframe': readingframe,
+            'nsteps': nsteps,
+            'nunits': len(model.perceptshaper),
+            'stepspersecond': nsteps / besttime,
+            'peakmemory': peakmemory,
+            'phasefractions': {name: stats[name] / totaltime
+                               for name in phases}}
+
+
+def report(results, baseline=None, tolerance=0.2):
+    """Prints results, compared with a baseline if given. Returns the names
+    of cases that are slower than the baseline by more than `tolerance`."""
+    regressions = []
+    header = f"{'case':<16}{'steps':>8}{'units':>7}{'steps/s':>11}" \
+             f"{'peak kB':>10}" + ''.join(f"{p[:-4]:>12}" for p in phases)
+    if baseline is not None:
+        header += f"{'vs base':>9}"
+    print(header)
+    for name, r in results.items():
+        line = f"{name:<16}{r['nsteps']:>8}{r['nunits']:>7}" \
+               f"{r['stepspersecond']:>11.0f}{r['peakmemory'] / 1024:>10.0f}" \
+               + ''.join(f"{r['phasefractions'][p]:>12.1%}" for p in phases)
+        if baseline is not None and name in baseline:
+            ratio = r['stepspersecond'] / baseline[name]['stepspersecond']
+            line += f"{ratio:>9.2f}"
+            if ratio < 1 - tolerance:
+                line += '  slower'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--save', action='store_true',
+                        help='store results as baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare results with stored baseline; exit '
+                             'with status 1 if a case regressed')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction by which steps/s may drop before a '
+                             'case counts as regressed (default 0.2)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='number of timed runs per case, of which the '
+                             'fastest counts (default 3)')
+    parser.add_argument('--cases', nargs='*', metavar='CASE',
+                        help='names of cases to run (default all)')
+    parser.add_argument('--model', choices=list(models), default='PARSER',
+                        help='the model to benchmark (default PARSER)')
+    args = parser.parse_args(args)
+    # baselines are stored per model
+    baselines = {}
+    if os.path.exists(baselinefile):
+        with open(baselinefile) as f:
+            baselines = json.load(f)
+    baseline = None
+    if args.compare:
+        if args.model not in baselines:
+            print(f"no baseline for {args.model} in {baselinefile}; store "
+                  f"one with --save", file=sys.stderr)
+            return 2
+        baseline = baselines[args.model]
+    selected = [case for case in cases
+                if not args.cases or case[0] in args.cases]
+    results = {name: runcase(*params, repeats=args.repeats,
+                             model=models[args.model])
+               for name, *params in selected}
+    regressions = report(results, baseline=baseline,
+                         tolerance=args.tolerance)
+    if args.save:
+        baselines.setdefault(args.model, {}).update(results)
+        with open(baselinefile, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())